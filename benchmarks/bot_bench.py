@@ -0,0 +1,476 @@
+"""End-to-end benchmarks for the bot's hot paths, fully offline.
+
+CTFtime is replaced by a local aiohttp fixture server and Discord by
+recording fake channels, so every scenario runs the real code in main.py,
+ctftime.py and pagination.py. Each scenario reports operations per second,
+p50/p99 latency, CTFtime and Discord API call counts, and peak traced memory.
+tracemalloc slows everything down noticeably; pass --no-memory for cleaner
+timings.
+
+Run from the repository root:
+
+    python benchmarks/bot_bench.py
+    python benchmarks/bot_bench.py --guilds 10000 --ctfs 1000
+    python benchmarks/bot_bench.py --scenario announcements status --send-latency 20
+
+The bot's state database is created in a temporary directory. The CTFtime
+rate limiter is lifted so the numbers measure the bot rather than the
+politeness limit; request counts are still exact.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from aiohttp import web
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ("announcements", "status", "dashboard", "prefix", "paginators", "warmstart")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[round(p * (len(values) - 1))]
+
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class FixtureServer:
+    """Local stand-in for the CTFtime API endpoints the bot uses, with per-path request counts"""
+
+    def __init__(self, events, teams_per_year=1000, teams_per_country=200):
+        self.events = events
+        self.teams_per_year = teams_per_year
+        self.teams_per_country = teams_per_country
+        self.requests = Counter()
+        self.runner = None
+        self.base = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/api/v1/events/", self.handle_events)
+        app.router.add_get("/api/v1/top/{year}/", self.handle_top)
+        app.router.add_get("/api/v1/top-by-country/{country}/", self.handle_country)
+        app.router.add_get("/api/v1/teams/{team_id}/", self.handle_team)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}/api/v1/"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def handle_events(self, request):
+        self.requests["events"] += 1
+        start, finish = int(request.query["start"]), int(request.query["finish"])
+        limit = int(request.query.get("limit", 100))
+        page = [event for event in self.events if start <= event["_start"] < finish][:limit]
+        etag = '"' + hashlib.sha1(repr([(e["id"], e["start"], e["title"]) for e in page]).encode()).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            self.requests["events_304"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        body = [{key: value for key, value in event.items() if key != "_start"} for event in page]
+        return web.json_response(body, headers={"ETag": etag})
+
+    async def handle_top(self, request):
+        self.requests["top"] += 1
+        year = request.match_info["year"]
+        limit = min(int(request.query.get("limit", 10)), self.teams_per_year)
+        teams = [{"team_id": i, "team_name": f"Team {i}", "points": 1000.0 - i} for i in range(1, limit + 1)]
+        return web.json_response({year: teams})
+
+    async def handle_country(self, request):
+        self.requests["top_by_country"] += 1
+        teams = [
+            {"team_id": i, "team_name": f"Local {i}", "country_place": i, "place": i * 7, "points": 500.0 - i, "events": 3}
+            for i in range(1, self.teams_per_country + 1)
+        ]
+        return web.json_response(teams)
+
+    async def handle_team(self, request):
+        self.requests["team"] += 1
+        team_id = int(request.match_info["team_id"])
+        return web.json_response({"id": team_id, "name": f"Team {team_id}", "aliases": [], "rating": {}})
+
+
+def make_events(count, now, days=7):
+    """`count` events spread over the next `days` days, sorted by start like CTFtime returns them"""
+    events = []
+    span = days * 24 * 60 * 60 - 2 * 60 * 60
+    for i in range(count):
+        start = now + 60 * 60 + span * i // max(count, 1)
+        events.append({
+            "id": 100000 + i,
+            "title": f"Fixture CTF {i}",
+            "start": iso(start),
+            "finish": iso(start + 48 * 60 * 60),
+            "format": "Jeopardy" if i % 5 else "Attack-Defense",
+            "url": f"https://ctf{i}.example",
+            "ctftime_url": f"https://ctftime.org/event/{100000 + i}/",
+            "onsite": i % 17 == 0,
+            "location": "",
+            "weight": float(i % 100),
+            "logo": "",
+            "description": "A fixture event. " * 10,
+            "participants": i,
+            "_start": start
+        })
+    return events
+
+
+class DiscordRecorder:
+    """Counts every Discord API call the fake channels receive"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.next_id = 1
+
+    async def call(self, kind):
+        self.calls[kind] += 1
+        await asyncio.sleep(self.latency)
+
+    def message(self, channel):
+        self.next_id += 1
+        return FakeMessage(self, channel, self.next_id)
+
+
+class FakeMessage:
+    def __init__(self, recorder, channel, message_id):
+        self.recorder = recorder
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs):
+        await self.recorder.call("edit")
+        return self
+
+    async def delete(self):
+        await self.recorder.call("delete")
+
+    async def pin(self):
+        await self.recorder.call("pin")
+
+
+class FakeChannel:
+    def __init__(self, recorder, channel_id):
+        self.recorder = recorder
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+
+    async def send(self, content=None, **kwargs):
+        await self.recorder.call("send")
+        return self.recorder.message(self)
+
+    async def fetch_message(self, message_id):
+        await self.recorder.call("fetch_message")
+        return FakeMessage(self.recorder, self, message_id)
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self.recorder, self, message_id)
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.results = []
+        self.now = int(time.time())
+        self.recorder = DiscordRecorder(args.send_latency / 1000)
+        self.channels = {}
+
+    def setup(self, main, ctftime):
+        self.main = main
+        self.ctftime = ctftime
+
+        # Point every CTFtime helper at the fixture server
+        ctftime.CTFTIME_API_EVENTS = self.server.base + "events/"
+        ctftime.CTFTIME_API_TOP_TEAMS = self.server.base + "top/"
+        ctftime.CTFTIME_API_TEAM_INFO = self.server.base + "teams/"
+        ctftime.CTFTIME_API_TOP_BY_COUNTRY = self.server.base + "top-by-country/"
+        ctftime.MAX_EVENT_PAGES = self.args.events // (ctftime.EVENTS_PAGE_SIZE // 2) + 2
+        ctftime.client.limiter.rate = ctftime.client.limiter.capacity = ctftime.client.limiter.tokens = 10 ** 9
+
+        config = {}
+        for guild in range(1, self.args.guilds + 1):
+            announce = self.channels[guild * 2] = FakeChannel(self.recorder, guild * 2)
+            status = self.channels[guild * 2 + 1] = FakeChannel(self.recorder, guild * 2 + 1)
+            config[str(guild)] = {
+                "announcement_channel_id": announce.id,
+                "current_ctf_channel_id": status.id,
+                "announcement_mode": "digest" if guild % 2 else "embeds",
+                "prefix": "?" if guild % 3 == 0 else "!"
+            }
+        main.server_config_cache = config
+        main.bot.get_channel = self.channels.get
+        main.dashboard_updates.delay = 0
+
+    async def settle(self):
+        """Wait for a dashboard update that check_ctf_status triggered"""
+        if self.main.dashboard_updates.task is not None:
+            await self.main.dashboard_updates.task
+
+    async def measure(self, name, run):
+        """Run one scenario coroutine, which returns (operations, latencies in seconds)"""
+        requests_before = Counter(self.server.requests)
+        discord_before = Counter(self.recorder.calls)
+        if self.args.memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        operations, latencies = await run()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if self.args.memory else 0
+
+        requests = self.server.requests - requests_before
+        discord_calls = self.recorder.calls - discord_before
+        self.results.append({
+            "scenario": name,
+            "ops": operations,
+            "seconds": elapsed,
+            "throughput": operations / elapsed if elapsed > 0 else 0.0,
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "ctftime": sum(requests.values()) - requests["events_304"],
+            "not_modified": requests["events_304"],
+            "discord": dict(discord_calls),
+            "peak_mib": peak / (1024 * 1024)
+        })
+
+    def delivery_latencies(self, label):
+        report = self.main.dispatcher.last_reports.get(label)
+        return (len(report.jobs), report.latencies) if report else (0, [])
+
+    # Scenarios
+
+    async def announcements(self):
+        main = self.main
+
+        async def cold():
+            await main.post_ctf_events()
+            return self.delivery_latencies("announcements")
+
+        async def warm():
+            await main.post_ctf_events()
+            return self.args.guilds, []
+
+        async def rescheduled():
+            for event in random.Random(1).sample(self.server.events, max(1, len(self.server.events) // 20)):
+                event["_start"] += 60 * 60
+                event["start"] = iso(event["_start"])
+                event["finish"] = iso(event["_start"] + 48 * 60 * 60)
+            self.server.events.sort(key=lambda event: event["_start"])
+            await main.post_ctf_events()
+            return self.delivery_latencies("announcements")
+
+        await self.measure("post_ctf_events cold", cold)
+        await self.measure("post_ctf_events warm", warm)
+        await self.measure("post_ctf_events 5% rescheduled", rescheduled)
+
+    def track_ctfs(self, starting):
+        """Track --ctfs CTFs, the first `starting` of which have just started"""
+        main = self.main
+        ctfs = []
+        for i in range(self.args.ctfs):
+            start = self.now - 1 if i < starting else self.now + 3600 + i * 60
+            ctfs.append({
+                "id": 900000 + i, "title": f"Tracked CTF {i}", "description": "", "start_time": start,
+                "end_time": start + 24 * 60 * 60, "url": "N/A", "ctftime_url": f"https://ctftime.org/event/{i}/",
+                "logo": "", "format": "Jeopardy", "weight": "25.00"
+            })
+        for ctf in ctfs:
+            main.store.track_ctf(ctf)
+        main.store.conn.execute("UPDATE tracked_ctfs SET started = 0 WHERE id >= 900000")
+        return ctfs
+
+    async def status(self):
+        main = self.main
+        for server_config in main.server_config_cache.values():
+            server_config["status_mode"] = "messages"
+        ctfs = self.track_ctfs(self.args.transitions)
+
+        async def start():
+            await main.check_ctf_status()
+            await self.settle()
+            return self.delivery_latencies("status updates")
+
+        async def end():
+            main.store.conn.execute(
+                "UPDATE tracked_ctfs SET end_time = ? WHERE id IN (%s)" % ", ".join("?" * self.args.transitions),
+                (self.now - 1, *(ctf["id"] for ctf in ctfs[:self.args.transitions]))
+            )
+            await main.check_ctf_status()
+            await self.settle()
+            return self.delivery_latencies("status updates")
+
+        await self.measure(f"check_ctf_status {self.args.transitions} starts", start)
+        await self.measure(f"check_ctf_status {self.args.transitions} ends", end)
+        main.store.remove_ctfs([ctf["id"] for ctf in ctfs])
+
+    async def dashboard(self):
+        main = self.main
+        for server_config in main.server_config_cache.values():
+            server_config["status_mode"] = "dashboard"
+        ctfs = self.track_ctfs(self.args.transitions)
+        main.dashboard_hashes.clear()
+
+        async def first():
+            await main.update_dashboards()
+            return self.delivery_latencies("dashboards")
+
+        async def transition():
+            main.store.track_ctf(dict(ctfs[-1], start_time=self.now - 1))
+            await main.check_ctf_status()
+            await self.settle()
+            return self.delivery_latencies("dashboards")
+
+        await self.measure("dashboard first render", first)
+        await self.measure("dashboard one transition", transition)
+        main.store.remove_ctfs([ctf["id"] for ctf in ctfs])
+
+    async def prefix(self):
+        main = self.main
+        rng = random.Random(2)
+        guilds = [SimpleNamespace(id=rng.randint(1, self.args.guilds)) for _ in range(self.args.messages)]
+        messages = [SimpleNamespace(guild=guild) for guild in guilds]
+
+        async def run():
+            latencies = []
+            for message in messages:
+                started = time.perf_counter()
+                main.get_prefix(main.bot, message)
+                latencies.append(time.perf_counter() - started)
+            return len(messages), latencies
+
+        await self.measure("get_prefix dispatch", run)
+
+    async def paginators(self):
+        from pagination import TopTeamsPaginator, TeamPaginator
+
+        rng = random.Random(3)
+        year = datetime.now(timezone.utc).year
+        clicks = []
+        for _ in range(self.args.clicks):
+            if rng.random() < 0.7:
+                key = TopTeamsPaginator.dataset_key(rng.choice((year, year - 1)), rng.choice((10, 100, 500)))
+                clicks.append((TopTeamsPaginator, key, rng.randint(0, 49)))
+            else:
+                clicks.append((TeamPaginator, rng.choice(("pl", "de", "us", "fr", "in")), rng.randint(0, 19)))
+
+        async def run():
+            latencies = []
+            for paginator, key, page in clicks:
+                started = time.perf_counter()
+                await paginator.show_page(key, page)
+                latencies.append(time.perf_counter() - started)
+            return len(clicks), latencies
+
+        await self.measure("paginator clicks", run)
+
+    async def warmstart(self):
+        main, ctftime = self.main, self.ctftime
+        year = datetime.now(timezone.utc).year
+        lookups = [lambda: ctftime.get_top_teams(year, 10)]
+        lookups += [lambda team_id=team_id: ctftime.get_team_info(team_id) for team_id in range(1, 51)]
+
+        async def first_lookups():
+            latencies = []
+            for lookup in lookups:
+                started = time.perf_counter()
+                await lookup()
+                latencies.append(time.perf_counter() - started)
+            return len(lookups), latencies
+
+        async def timed(call):
+            started = time.perf_counter()
+            await call()
+            return 1, [time.perf_counter() - started]
+
+        await main.post_ctf_events()
+        await first_lookups()
+        await self.measure("snapshot save", lambda: timed(main.save_snapshot))
+
+        # Simulate a restart by dropping everything the snapshot holds, then restore it
+        for cache in ctftime.caches:
+            cache.entries.clear()
+        ctftime.event_page_validators.clear()
+        main.event_sync.known.clear()
+        for event_id in list(main.catalogue.events):
+            main.catalogue.remove(event_id)
+        await self.measure("snapshot load", lambda: timed(main.load_snapshot))
+        await self.measure("lookups after restart", first_lookups)
+        await self.measure("event sync after restart", lambda: timed(main.post_ctf_events))
+
+    def report(self):
+        header = f"{'scenario':<32} {'ops':>8} {'sec':>8} {'ops/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'ctftime (304)':>13} {'peak MiB':>9}  discord"
+        print(header)
+        print("-" * len(header))
+        for result in self.results:
+            calls = f"{result['ctftime']} ({result['not_modified']})"
+            discord_calls = ", ".join(f"{kind} {count}" for kind, count in sorted(result["discord"].items())) or "-"
+            print(
+                f"{result['scenario']:<32} {result['ops']:>8} {result['seconds']:>8.3f} {result['throughput']:>10.1f} "
+                f"{result['p50'] * 1000:>8.3f} {result['p99'] * 1000:>8.3f} {calls:>13} "
+                f"{result['peak_mib']:>9.1f}  {discord_calls}"
+            )
+
+
+async def run(args):
+    bench = Bench(args)
+    bench.server = FixtureServer(make_events(args.events, bench.now))
+    await bench.server.start()
+
+    # main.py opens its state database in the working directory on import
+    workdir = tempfile.mkdtemp(prefix="ctfbot-bench-")
+    os.chdir(workdir)
+    import ctftime
+    import main
+
+    bench.setup(main, ctftime)
+    try:
+        for scenario in args.scenario:
+            await getattr(bench, scenario)()
+    finally:
+        await ctftime.close()
+        await bench.server.stop()
+        main.store.close()
+
+    print()
+    print(f"{args.guilds} guilds, {args.events} fixture events, {args.ctfs} tracked CTFs, "
+          f"send latency {args.send_latency}ms, state in {workdir}")
+    bench.report()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=100, help="upcoming events served by the fixture")
+    parser.add_argument("--ctfs", type=int, default=1000, help="tracked CTFs for the status scenarios")
+    parser.add_argument("--transitions", type=int, default=5, help="CTFs starting/ending at once")
+    parser.add_argument("--messages", type=int, default=100000, help="messages for get_prefix")
+    parser.add_argument("--clicks", type=int, default=2000, help="paginator button presses")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="simulated Discord latency in ms")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip tracemalloc")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.memory:
+        tracemalloc.start()
+    asyncio.run(run(args))
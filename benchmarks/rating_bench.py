@@ -0,0 +1,50 @@
+"""Compare the scalar calculate_rating loop with the vectorized calculate_ratings.
+
+Run from the repository root:
+
+    python benchmarks/rating_bench.py [teams ...]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rating import calculate_rating, calculate_ratings  # noqa: E402
+
+WEIGHT = 50.0
+
+
+def make_scoreboard(teams, seed=0):
+    rng = np.random.default_rng(seed)
+    points = np.sort(rng.integers(0, 10000, size=teams).astype(np.float64))[::-1]
+    places = np.arange(1, teams + 1, dtype=np.float64)
+    return places, points
+
+
+def scalar(places, points):
+    best = points.max()
+    total = len(places)
+    return [calculate_rating(WEIGHT, total, best, place, score) for place, score in zip(places.tolist(), points.tolist())]
+
+
+def vectorized(places, points):
+    return calculate_ratings(WEIGHT, len(places), points.max(), places, points)
+
+
+def main(sizes):
+    print(f"{'teams':>8} {'scalar ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for teams in sizes:
+        places, points = make_scoreboard(teams)
+        assert np.allclose(scalar(places, points), vectorized(places, points))
+
+        number = max(1, 200000 // teams)
+        scalar_time = min(timeit.repeat(lambda: scalar(places, points), number=number, repeat=5)) / number
+        vector_time = min(timeit.repeat(lambda: vectorized(places, points), number=number, repeat=5)) / number
+        print(f"{teams:>8} {scalar_time * 1000:>10.3f} {vector_time * 1000:>10.3f} {scalar_time / vector_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 10000, 100000])
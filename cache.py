@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded LRU cache of async fetch results with a time-to-live.
+
+    Entries younger than `ttl` are served directly. Entries older than that but
+    younger than `ttl + stale_ttl` are still served immediately, while a single
+    background refresh replaces them. Empty results (how the CTFtime helpers
+    signal errors) are never cached; if a fetch fails and an older entry is
+    still held, that entry is served instead, so callers keep getting data
+    while upstream is down.
+    """
+
+    def __init__(self, name, ttl, max_entries, stale_ttl=24 * 60 * 60):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (fetched_at, value)
+        self.refreshing = {}  # key -> background refresh task
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fallbacks = 0
+
+    def get(self, key):
+        """Return the cached value regardless of age, or None"""
+        entry = self.entries.get(key)
+        return entry[1] if entry else None
+
+    def set(self, key, value, fetched_at=None):
+        self.entries[key] = (time.time() if fetched_at is None else fetched_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def snapshot(self):
+        """Entries as [key, fetched_at, value], least recently used first"""
+        return [[key, fetched_at, value] for key, (fetched_at, value) in self.entries.items()]
+
+    def restore(self, entries):
+        """Load entries from snapshot() with their original age, so stale ones get revalidated on first use"""
+        cutoff = time.time() - self.ttl - self.stale_ttl
+        for key, fetched_at, value in entries:
+            key = tuple(key) if isinstance(key, list) else key  # JSON turns tuple keys into lists
+            if fetched_at > cutoff and key not in self.entries:
+                self.set(key, value, fetched_at)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    async def get_or_fetch(self, key, fetch):
+        """Return the value for key, calling the `fetch` coroutine function on a miss"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < self.ttl:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self.entries.move_to_end(key)
+                self.refresh(key, fetch)
+                return entry[1]
+
+        self.misses += 1
+        value = await fetch()
+        if value:
+            self.set(key, value)
+        elif entry is not None:
+            self.fallbacks += 1
+            return entry[1]
+        return value
+
+    def refresh(self, key, fetch):
+        if key in self.refreshing:
+            return
+        task = asyncio.create_task(self._refresh(key, fetch))
+        self.refreshing[key] = task
+
+    async def _refresh(self, key, fetch):
+        try:
+            value = await fetch()
+            if value:
+                self.set(key, value)
+        finally:
+            del self.refreshing[key]
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "fallbacks": self.fallbacks,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
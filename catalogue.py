@@ -0,0 +1,103 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+
+
+def parse_time(value):
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+class EventCatalogue:
+    """Local, time-indexed copy of the CTFtime events the bot has fetched.
+
+    Events are kept until they finish. The time index is a list of
+    (start, id) sorted by start, plus the longest event duration seen. Any
+    event overlapping [lo, hi) must start in [lo - longest, hi), so a query
+    bisects to that slice instead of scanning everything. Secondary indexes
+    map format and onsite/online to event ids, and keep (weight, id) sorted
+    for minimum-weight filters.
+    """
+
+    def __init__(self):
+        self.events = {}  # id -> (start, end, event)
+        self.by_start = []
+        self.longest = 0
+        self.by_format = {}
+        self.by_onsite = {True: set(), False: set()}
+        self.by_weight = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, event, start=None, end=None):
+        start = parse_time(event["start"]) if start is None else start
+        end = parse_time(event["finish"]) if end is None else end
+        if event["id"] in self.events:
+            self.remove(event["id"])
+
+        event_id = event["id"]
+        self.events[event_id] = (start, end, event)
+        insort(self.by_start, (start, event_id))
+        self.longest = max(self.longest, end - start)
+        self.by_format.setdefault(str(event.get("format", "")).lower(), set()).add(event_id)
+        self.by_onsite[bool(event.get("onsite"))].add(event_id)
+        insort(self.by_weight, (self.weight(event), event_id))
+
+    def remove(self, event_id):
+        start, end, event = self.events.pop(event_id)
+        del self.by_start[bisect_left(self.by_start, (start, event_id))]
+        self.by_format[str(event.get("format", "")).lower()].discard(event_id)
+        self.by_onsite[bool(event.get("onsite"))].discard(event_id)
+        del self.by_weight[bisect_left(self.by_weight, (self.weight(event), event_id))]
+
+    @staticmethod
+    def weight(event):
+        try:
+            return float(event.get("weight") or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def snapshot(self):
+        return [[start, end, event] for start, end, event in self.events.values()]
+
+    def restore(self, entries, now):
+        """Add events from snapshot() that have not finished yet"""
+        for start, end, event in entries:
+            if end > now and event["id"] not in self.events:
+                self.add(event, start, end)
+
+    def refresh(self, events, now):
+        """Merge freshly fetched events in and drop everything that has finished"""
+        for event in events:
+            self.add(event)
+        for event_id in [event_id for event_id, (start, end, event) in self.events.items() if end <= now]:
+            self.remove(event_id)
+        self.longest = max((end - start for start, end, event in self.events.values()), default=0)
+
+    def query(self, lo, hi, format=None, min_weight=None, onsite=None):
+        """Events overlapping [lo, hi), sorted by start, optionally filtered"""
+        first = bisect_left(self.by_start, (lo - self.longest,))
+        last = bisect_left(self.by_start, (hi,))
+        ids = [event_id for start, event_id in self.by_start[first:last] if self.events[event_id][1] > lo]
+
+        if format is not None:
+            allowed = self.by_format.get(format.lower(), set())
+            ids = [event_id for event_id in ids if event_id in allowed]
+        if onsite is not None:
+            allowed = self.by_onsite[onsite]
+            ids = [event_id for event_id in ids if event_id in allowed]
+        if min_weight is not None:
+            allowed = {event_id for weight, event_id in self.by_weight[bisect_left(self.by_weight, (min_weight,)):]}
+            ids = [event_id for event_id in ids if event_id in allowed]
+
+        return [self.events[event_id] for event_id in ids]
+
+    def running(self, now, **filters):
+        return [entry for entry in self.query(now, now + 1, **filters) if entry[0] <= now]
+
+    def upcoming(self, now, until, **filters):
+        return [entry for entry in self.query(now, until, **filters) if entry[0] >= now]
+
+    def next_start(self, now):
+        """Start time of the first event starting after now, or None"""
+        i = bisect_left(self.by_start, (now + 1,))
+        return self.by_start[i][0] if i < len(self.by_start) else None
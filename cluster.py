@@ -0,0 +1,80 @@
+import asyncio
+import os
+import socket
+import time
+
+LEADER_LEASE = "leader"
+LEASE_TTL = 30  # seconds a leader keeps the lease without renewing it
+POLL_INTERVAL = 2  # seconds between lease renewals and message polls
+MESSAGE_RETENTION = 60 * 60
+
+
+def shard_for_guild(guild_id, shard_count):
+    """The shard Discord routes a guild to"""
+    return (int(guild_id) >> 22) % shard_count
+
+
+class Cluster:
+    """Coordinates bot processes that each run some shards over one shared Storage.
+
+    The processes elect a leader with a lease row that it renews every
+    POLL_INTERVAL. If it stops renewing, another process takes over once the
+    lease expires. Only the leader runs the CTFtime sync and the status
+    scheduler. It broadcasts what it found as messages in the store. Every
+    process polls for messages from the others and hands each one to the
+    handler for its kind. Handlers only act on the guilds their own shards
+    hold, so per-guild delivery is spread across the processes.
+    """
+
+    def __init__(self, store, handlers, on_leader_change=None):
+        self.store = store
+        self.handlers = handlers  # kind -> async function(payload)
+        self.on_leader_change = on_leader_change
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.last_message_id = None
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.last_message_id = self.store.last_message_id()  # only act on messages from now on
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.is_leader:
+            self.store.release_lease(LEADER_LEASE, self.holder)
+            self.is_leader = False
+
+    def publish(self, kind, payload):
+        self.store.publish_message(self.holder, kind, payload, time.time())
+
+    async def run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Error in cluster coordination: {e!r}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def tick(self):
+        leader = self.store.acquire_lease(LEADER_LEASE, self.holder, LEASE_TTL, time.time())
+        if leader != self.is_leader:
+            self.is_leader = leader
+            print(f"{self.holder} is {'now' if leader else 'no longer'} the leader")
+            if self.on_leader_change is not None:
+                await self.on_leader_change(leader)
+        if leader:
+            self.store.prune_messages(time.time() - MESSAGE_RETENTION)
+
+        for message_id, kind, payload in self.store.messages_since(self.last_message_id, self.holder):
+            self.last_message_id = message_id
+            handler = self.handlers.get(kind)
+            if handler is None:
+                continue
+            try:
+                await handler(payload)
+            except Exception as e:
+                print(f"Error handling cluster message {kind}: {e!r}")
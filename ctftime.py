@@ -0,0 +1,386 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+
+from cache import TTLCache
+from ratelimit import TokenBucket, CircuitBreaker, backoff_delay
+import metrics
+
+CTFTIME_API_EVENTS = "https://ctftime.org/api/v1/events/"
+CTFTIME_API_TOP_TEAMS = "https://ctftime.org/api/v1/top/"
+CTFTIME_API_TEAM_INFO = "https://ctftime.org/api/v1/teams/"
+CTFTIME_API_TOP_BY_COUNTRY = "https://ctftime.org/api/v1/top-by-country/"
+USER_AGENT = "DiscordBot (https://yourbotwebsite.com, v1.0)"
+
+EVENTS_PAGE_SIZE = 100
+MAX_EVENT_PAGES = 10
+MAX_CONCURRENT_REQUESTS = 4
+REQUEST_TIMEOUT = 15  # seconds, for the whole request
+CONNECT_TIMEOUT = 5
+KEEPALIVE_TIMEOUT = 60
+REQUESTS_PER_SECOND = 2  # sustained rate across every CTFtime call
+REQUEST_BURST = 8
+MAX_QUEUE_WAIT = 10  # seconds a request may wait for the limiter before failing
+MAX_RETRIES = 3  # extra attempts after a 429, 5xx or connection error
+MAX_RETRY_DELAY = 30
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 60
+
+
+class CTFtimeClient:
+    """Shared aiohttp session for all CTFtime API calls.
+
+    Connections are kept alive between calls and at most
+    MAX_CONCURRENT_REQUESTS requests are in flight at any time. Identical
+    concurrent requests (same URL and params) share a single upstream call.
+
+    Every attempt takes a token from a shared token bucket. 429s, 5xx and
+    connection errors are retried with jittered exponential backoff, and feed
+    a circuit breaker that fails calls fast while CTFtime is unhealthy, so
+    callers fall back to cached data instead of queueing behind timeouts.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_REQUESTS, timeout=REQUEST_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT)
+        self.session = None
+        self.semaphore = None
+        self.in_flight = {}  # (url, params) -> task shared by every concurrent caller
+        self.coalesced = 0
+        self.limiter = TokenBucket(REQUESTS_PER_SECOND, REQUEST_BURST)
+        self.breaker = CircuitBreaker("CTFtime", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        self.retries = 0
+        self.statuses = {}  # HTTP status (or error name) -> count
+
+    def get_session(self):
+        # Created lazily so the session and semaphore bind to the bot's running loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"User-Agent": USER_AGENT}
+            )
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.session
+
+    async def get_json(self, url, params=None):
+        """GET a CTFtime endpoint, returning (status, data). data is None unless status is 200"""
+        status, data, headers = await self.request(url, params)
+        return status, data
+
+    async def get_json_conditional(self, url, params=None, etag=None, last_modified=None):
+        """Like get_json, but sends the given validators and returns (status, data, etag, last_modified).
+
+        A 304 status means the cached copy the validators came from is still current.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        status, data, response_headers = await self.request(url, params, headers)
+        return status, data, response_headers.get("ETag"), response_headers.get("Last-Modified")
+
+    async def request(self, url, params=None, headers=None):
+        key = (url, tuple(sorted((params or {}).items())), tuple(sorted((headers or {}).items())))
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self.fetch_json(url, params, headers))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self.request_done(key, t))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller giving up does not cancel the request for the others
+        return await asyncio.shield(task)
+
+    def request_done(self, key, task):
+        self.in_flight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved in case every caller was cancelled
+
+    async def fetch_json(self, url, params=None, headers=None):
+        session = self.get_session()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                await self.limiter.acquire(MAX_QUEUE_WAIT)
+                async with self.semaphore:
+                    started = time.perf_counter()
+                    try:
+                        async with session.get(url, params=params, headers=headers) as response:
+                            status, response_headers = response.status, response.headers
+                            data = await response.json(content_type=None) if status == 200 else None
+                    finally:
+                        metrics.ctftime_latency.observe((endpoint_name(url),), time.perf_counter() - started)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.count_status(type(e).__name__, url)
+                self.breaker.record_failure()
+                if attempt >= MAX_RETRIES or self.breaker.state == "open":
+                    raise
+                delay = backoff_delay(attempt, cap=MAX_RETRY_DELAY)
+            except BaseException:
+                self.breaker.probing = False  # limiter rejection or cancellation; not upstream's fault
+                raise
+            else:
+                self.count_status(status, url)
+                if status != 429 and status < 500:
+                    self.breaker.record_success()
+                    return status, data, response_headers
+                self.breaker.record_failure()
+                delay = max(backoff_delay(attempt, cap=MAX_RETRY_DELAY), retry_after(response_headers))
+                if attempt >= MAX_RETRIES or self.breaker.state == "open" or delay > MAX_RETRY_DELAY:
+                    return status, None, response_headers
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def count_status(self, status, url):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        metrics.ctftime_responses.inc((endpoint_name(url), status))
+
+    def stats(self):
+        return {
+            "limiter": self.limiter.stats(),
+            "breaker": self.breaker.stats(),
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "statuses": dict(self.statuses)
+        }
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+def endpoint_name(url):
+    """Short name of the API endpoint a URL belongs to, for metrics labels"""
+    for name, base in (("events", CTFTIME_API_EVENTS), ("top_by_country", CTFTIME_API_TOP_BY_COUNTRY),
+                       ("top", CTFTIME_API_TOP_TEAMS), ("teams", CTFTIME_API_TEAM_INFO)):
+        if url.startswith(base):
+            return name
+    return "other"
+
+
+def retry_after(headers):
+    """Seconds asked for by a Retry-After header, 0 if absent or not a number of seconds"""
+    try:
+        return float(headers.get("Retry-After", 0))
+    except ValueError:
+        return 0
+
+
+client = CTFtimeClient()
+
+# Leaderboards move a few times a day, team profiles even less
+top_teams_cache = TTLCache("top_teams", ttl=60 * 60, max_entries=64)
+team_info_cache = TTLCache("team_info", ttl=6 * 60 * 60, max_entries=1024)
+top_by_country_cache = TTLCache("top_by_country", ttl=60 * 60, max_entries=256)
+caches = (top_teams_cache, team_info_cache, top_by_country_cache)
+
+# (page start, finish) -> (etag, last_modified, events) from the latest events fetch
+event_page_validators = {}
+
+# Callbacks given [(team_id, name), ...] whenever a fetch returns team names
+team_listeners = []
+
+
+def publish_teams(teams):
+    if teams:
+        for listener in team_listeners:
+            listener(teams)
+
+
+async def close():
+    await client.close()
+
+
+async def fetch_events_window(start, finish):
+    """Fetch every event starting in [start, finish), following pages past EVENTS_PAGE_SIZE.
+
+    CTFtime has no offset parameter, so each further page starts at the last
+    start time seen, and events repeated across the boundary are dropped. Each
+    page is requested conditionally with the validators from the previous
+    fetch of the same page. Returns (events, complete). complete is False if
+    the page cap was hit or a page failed.
+    """
+    global event_page_validators
+    events = {}
+    validators = {}
+    page_start = start
+    complete = False
+
+    for _ in range(MAX_EVENT_PAGES):
+        params = {
+            "limit": EVENTS_PAGE_SIZE,
+            "start": page_start,
+            "finish": finish
+        }
+        key = (page_start, finish)
+        etag, last_modified, cached = event_page_validators.get(key, (None, None, None))
+        status, data, etag, last_modified = await client.get_json_conditional(
+            CTFTIME_API_EVENTS, params, etag, last_modified
+        )
+        if status == 304 and cached is not None:
+            data = cached
+            etag, last_modified = event_page_validators[key][:2]
+        elif status != 200:
+            print(f"Error fetching CTFtime events: {status}")
+            break
+        validators[key] = (etag, last_modified, data)
+
+        for event in data:
+            events[event["id"]] = event
+        if len(data) < EVENTS_PAGE_SIZE:
+            complete = True
+            break
+        last_start = max(int(datetime.fromisoformat(event["start"].replace("Z", "+00:00")).timestamp()) for event in data)
+        if last_start <= page_start:
+            break  # a whole page starting at the same second; cannot advance further
+        page_start = last_start
+
+    # Only keep validators for pages of the current window
+    event_page_validators = validators
+    return list(events.values()), complete
+
+
+def events_window(days=7):
+    """(start, finish) timestamps of the next `days` days.
+
+    Rounded to the hour so the page URLs stay stable between polls, which
+    lets overlapping callers share a request and conditional requests hit.
+    """
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return int(now.timestamp()), int((now + timedelta(days=days)).timestamp())
+
+
+async def fetch_top_teams(year=None, limit=10):
+    try:
+        url = CTFTIME_API_TOP_TEAMS
+        if year:
+            url += f"{year}/"
+        params = {"limit": limit}
+        status, data = await client.get_json(url, params=params)
+        if status == 200:
+            # CTFtime has no offset, so each longer list repeats the shorter ones; keep only the longest
+            for key in [key for key in top_teams_cache.entries if key[0] == year and key[1] < limit]:
+                top_teams_cache.discard(key)
+            for teams in data.values():
+                publish_teams([(team["team_id"], team["team_name"]) for team in teams])
+            return data
+        else:
+            print(f"Error fetching top teams: {status}")
+            return {}
+    except Exception as e:
+        print(f"Error occurred while fetching top teams: {e!r}")
+        return {}
+
+
+async def fetch_team_info(team_id):
+    try:
+        url = f"{CTFTIME_API_TEAM_INFO}{team_id}/"
+        status, data = await client.get_json(url)
+        if status == 200:
+            names = [data.get("name"), data.get("primary_alias"), *data.get("aliases", [])]
+            publish_teams([(team_id, name) for name in names if name])
+            return data
+        else:
+            print(f"Error fetching team info: {status}")
+            return {}
+    except Exception as e:
+        print(f"Error occurred while fetching team info: {e!r}")
+        return {}
+
+
+async def fetch_top_teams_by_country(country_code):
+    try:
+        url = f"{CTFTIME_API_TOP_BY_COUNTRY}{country_code}/"
+        status, data = await client.get_json(url)
+        if status == 200:
+            publish_teams([(team["team_id"], team["team_name"]) for team in data if "team_id" in team])
+            return data
+        else:
+            print(f"Error fetching top teams by country: {status}")
+            return []
+    except Exception as e:
+        print(f"Error occurred while fetching top teams by country: {e!r}")
+        return []
+
+
+def top_teams_key(year, limit):
+    """Cache key for the top `limit` teams of `year`: the shortest cached list that covers them, if any"""
+    covering = [key[1] for key in top_teams_cache.entries if key[0] == year and key[1] >= limit]
+    return (year, min(covering)) if covering else (year, limit)
+
+
+async def get_top_teams(year=None, limit=10):
+    """Top teams of a year. May return more than `limit` teams when a longer list is already cached"""
+    key = top_teams_key(year, limit)
+    return await top_teams_cache.get_or_fetch(key, lambda: fetch_top_teams(year, key[1]))
+
+
+async def get_team_info(team_id):
+    return await team_info_cache.get_or_fetch(team_id, lambda: fetch_team_info(team_id))
+
+
+async def get_top_teams_by_country(country_code):
+    country_code = country_code.lower()
+    return await top_by_country_cache.get_or_fetch(country_code, lambda: fetch_top_teams_by_country(country_code))
+
+
+def cache_stats():
+    return [cache.stats() for cache in caches]
+
+
+def snapshot_state():
+    """Cached responses and event page validators, for a warm start after a restart"""
+    return {
+        "caches": {cache.name: cache.snapshot() for cache in caches},
+        "event_pages": [
+            [start, finish, etag, last_modified, events]
+            for (start, finish), (etag, last_modified, events) in event_page_validators.items()
+        ]
+    }
+
+
+def restore_state(state):
+    for cache in caches:
+        cache.restore(state["caches"].get(cache.name, []))
+    if not event_page_validators:
+        for start, finish, etag, last_modified, events in state["event_pages"]:
+            event_page_validators[(start, finish)] = (etag, last_modified, events)
+
+
+def cache_metrics():
+    """Prometheus exposition lines for the caches, limiter and circuit breaker"""
+    lines = ["# TYPE ctfbot_cache_lookups_total counter"]
+    for stats in cache_stats():
+        for result in ("hits", "stale_hits", "misses", "fallbacks"):
+            lines.append(f'ctfbot_cache_lookups_total{{cache="{stats["name"]}",result="{result}"}} {stats[result]}')
+    lines.append("# TYPE ctfbot_cache_entries gauge")
+    lines.extend(f'ctfbot_cache_entries{{cache="{stats["name"]}"}} {stats["entries"]}' for stats in cache_stats())
+
+    client_stats = client.stats()
+    breaker = client_stats["breaker"]
+    lines.append("# TYPE ctfbot_ctftime_breaker_open gauge")
+    lines.append(f"ctfbot_ctftime_breaker_open {int(breaker['state'] != 'closed')}")
+    lines.append("# TYPE ctfbot_ctftime_breaker_short_circuited_total counter")
+    lines.append(f"ctfbot_ctftime_breaker_short_circuited_total {breaker['short_circuited']}")
+    lines.append("# TYPE ctfbot_ctftime_limiter_rejected_total counter")
+    lines.append(f"ctfbot_ctftime_limiter_rejected_total {client_stats['limiter']['rejected']}")
+    lines.append("# TYPE ctfbot_ctftime_retries_total counter")
+    lines.append(f"ctfbot_ctftime_retries_total {client_stats['retries']}")
+    lines.append("# TYPE ctfbot_ctftime_coalesced_total counter")
+    lines.append(f"ctfbot_ctftime_coalesced_total {client_stats['coalesced']}")
+    return lines
+
+
+metrics.collectors.append(cache_metrics)
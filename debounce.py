@@ -0,0 +1,32 @@
+import asyncio
+
+
+class Debouncer:
+    """Runs a coroutine function once, `delay` seconds after the first of a burst of triggers.
+
+    Triggers that arrive while the call is waiting are folded into it. A
+    trigger that arrives while the call is already running schedules one more.
+    """
+
+    def __init__(self, callback, delay):
+        self.callback = callback
+        self.delay = delay
+        self.task = None
+        self.runs = 0
+        self.triggers = 0
+
+    def trigger(self):
+        self.triggers += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.task = None
+        self.runs += 1
+        try:
+            await self.callback()
+        except Exception as e:
+            print(f"Error in debounced {self.callback.__name__}: {e!r}")
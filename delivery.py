@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import metrics
+
+MAX_DELIVERY_WORKERS = 16
+
+
+class DeliveryJob:
+    """One Discord API call to make for a guild.
+
+    `send` is a zero-argument coroutine function. `context` is whatever the
+    caller needs back to act on the result (e.g. the events in a message).
+    """
+
+    def __init__(self, server_id, channel_id, send, context=None):
+        self.server_id = server_id
+        self.channel_id = channel_id
+        self.send = send
+        self.context = context
+        self.result = None
+        self.error = None
+        self.latency = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class DeliveryReport:
+    def __init__(self, label, jobs, elapsed):
+        self.label = label
+        self.jobs = jobs
+        self.elapsed = elapsed
+        self.sent = sum(1 for job in jobs if job.ok)
+        self.failed = len(jobs) - self.sent
+        self.latencies = sorted(job.latency for job in jobs if job.latency is not None)
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        return self.latencies[round(p * (len(self.latencies) - 1))]
+
+    @property
+    def throughput(self):
+        return len(self.jobs) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"{self.label}: {self.sent} sent, {self.failed} failed in {self.elapsed:.2f}s "
+            f"({self.throughput:.1f}/s, p50 {self.percentile(0.5) * 1000:.0f}ms, "
+            f"p99 {self.percentile(0.99) * 1000:.0f}ms)"
+        )
+
+
+class DeliveryDispatcher:
+    """Runs Discord sends for many guilds concurrently with a bounded worker pool.
+
+    Jobs are grouped by channel, which is the rate-limit bucket Discord uses for
+    message routes. Each channel's jobs run in order, one at a time, so a
+    channel is never burst against its own bucket and announcements keep
+    their order. Different channels run in parallel, up to `max_workers` at
+    once. discord.py still handles any 429s on top of this. A failing job only
+    affects that job.
+    """
+
+    def __init__(self, max_workers=MAX_DELIVERY_WORKERS):
+        self.max_workers = max_workers
+        self.last_reports = {}  # label -> most recent DeliveryReport
+
+    async def dispatch(self, jobs, label="delivery"):
+        jobs = list(jobs)
+        started = time.perf_counter()
+        if jobs:
+            by_channel = {}
+            for job in jobs:
+                by_channel.setdefault(job.channel_id, []).append(job)
+
+            semaphore = asyncio.Semaphore(self.max_workers)
+            await asyncio.gather(*(self.run_channel(channel_jobs, semaphore) for channel_jobs in by_channel.values()))
+
+        report = DeliveryReport(label, jobs, time.perf_counter() - started)
+        self.last_reports[label] = report
+        metrics.observe_delivery(report)
+        return report
+
+    async def run_channel(self, jobs, semaphore):
+        async with semaphore:
+            for job in jobs:
+                job_started = time.perf_counter()
+                try:
+                    job.result = await job.send()
+                except Exception as e:
+                    job.error = e
+                    print(f"Delivery to server {job.server_id} failed: {e}")
+                job.latency = time.perf_counter() - job_started
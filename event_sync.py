@@ -0,0 +1,104 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+
+import ctftime
+
+# Fields that matter to announcements and tracking. Participant counts and
+# similar churn are left out so they do not register as changes.
+FINGERPRINT_FIELDS = ("title", "start", "finish", "format", "url", "ctftime_url", "onsite",
+                      "location", "weight", "logo", "description", "prizes", "organizers")
+
+
+def fingerprint(event):
+    data = {field: event.get(field) for field in FINGERPRINT_FIELDS}
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def event_start(event):
+    return int(datetime.fromisoformat(event["start"].replace("Z", "+00:00")).timestamp())
+
+
+class EventDelta:
+    """Result of one sync: the full event list plus what changed since the last sync"""
+
+    def __init__(self, events, added, changed, removed, complete):
+        self.events = events
+        self.added = added
+        self.changed = changed  # (old event, new event) pairs
+        self.removed = removed
+        self.complete = complete
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def summary(self):
+        return f"{len(self.events)} events: {len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed"
+
+
+class EventSync:
+    """Turns repeated CTFtime event-window fetches into added/changed/removed deltas.
+
+    An event counts as removed only if it disappeared while its start time is
+    still inside the fetched window (cancelled or moved out), and only when
+    the fetch was complete. Events that simply started and left the window
+    are dropped quietly.
+    """
+
+    def __init__(self):
+        self.known = {}  # event id -> (fingerprint, event)
+        self.last_sync = None
+        self.last_delta = None
+
+    def snapshot(self):
+        return {
+            "events": [event for fp, event in self.known.values()],
+            "last_sync": self.last_sync.timestamp() if self.last_sync else None
+        }
+
+    def restore(self, state):
+        """Resume from snapshot() so the first sync after a restart only reports what changed while down"""
+        if self.known:
+            return
+        self.known = {event["id"]: (fingerprint(event), event) for event in state["events"]}
+        if state["last_sync"] is not None:
+            self.last_sync = datetime.fromtimestamp(state["last_sync"], timezone.utc)
+
+    async def sync(self, days=7):
+        start, finish = ctftime.events_window(days)
+        try:
+            events, complete = await ctftime.fetch_events_window(start, finish)
+        except Exception as e:
+            print(f"Error occurred while fetching events: {e!r}")
+            events, complete = [], False
+        if not events and not complete:
+            # Nothing usable came back; keep the previous state rather than reporting removals
+            self.last_delta = EventDelta([event for fp, event in self.known.values()], [], [], [], False)
+        else:
+            self.last_delta = self.diff(events, start, finish, complete)
+        return self.last_delta
+
+    def diff(self, events, start, finish, complete):
+        added, changed = [], []
+        current = {}
+        for event in events:
+            fp = fingerprint(event)
+            current[event["id"]] = (fp, event)
+            previous = self.known.get(event["id"])
+            if previous is None:
+                added.append(event)
+            elif previous[0] != fp:
+                changed.append((previous[1], event))
+
+        removed = []
+        for event_id, (fp, event) in self.known.items():
+            if event_id in current:
+                continue
+            if complete and start <= event_start(event) < finish:
+                removed.append(event)
+            elif not complete:
+                current[event_id] = (fp, event)  # may just be on a page we did not get
+
+        self.known = current
+        self.last_sync = datetime.now(timezone.utc)
+        return EventDelta(events, added, changed, removed, complete)
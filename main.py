@@ -1,22 +1,61 @@
+import asyncio
 import discord
-import requests
 import json
 import os
+import hashlib
+import io
 import math
+import typing
 from discord.ext import commands, tasks
 from discord.ext.commands import has_permissions
 from datetime import datetime, timedelta, timezone
-from discord import ButtonStyle
-from discord.ui import Button, View
 from datetime import datetime
 import time
+from storage import Storage, CTF_COLUMNS
+from scheduler import DeadlineScheduler
+from delivery import DeliveryDispatcher, DeliveryJob
+from pagination import PageButton, TopTeamsPaginator, TeamPaginator
+from catalogue import EventCatalogue
+from team_index import TeamIndex
+from event_sync import EventSync, EventDelta, event_start
+from cluster import Cluster, shard_for_guild
+from polling import AdaptivePoller
+from debounce import Debouncer
+from metrics import MetricsServer
+from profiling import BlockingWatchdog, SamplingProfiler
+from snapshot import read_snapshot, write_snapshot
+import metrics
+from ctftime import get_top_teams, get_team_info, get_top_teams_by_country
+import ctftime
 
 TOKEN = 'REDACTED'
-CTFTIME_API_EVENTS = "https://ctftime.org/api/v1/events/"
-CTFTIME_API_TOP_TEAMS = "https://ctftime.org/api/v1/top/"
-CTFTIME_API_TEAM_INFO = "https://ctftime.org/api/v1/teams/"
-CTFTIME_API_TOP_BY_COUNTRY = "https://ctftime.org/api/v1/top-by-country/"
+STATE_DB_FILE = 'bot_state.db'
+LEDGER_RETENTION = timedelta(days=30)
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+DIGEST_EVENTS_PER_EMBED = 15
+MAX_SCOREBOARD_BYTES = 5 * 1024 * 1024
+MIN_POLL_INTERVAL = 5 * 60  # seconds between event syncs while CTFtime is changing
+MAX_POLL_INTERVAL = 2 * 60 * 60  # seconds between event syncs once it has been quiet
+DEFAULT_HORIZON_DAYS = 7  # how far ahead events are announced, per guild with !sethorizon
+MAX_HORIZON_DAYS = 30
+DASHBOARD_DEBOUNCE = 5  # seconds to gather nearby CTF transitions into one dashboard edit
+MAX_DASHBOARD_CTFS = 25
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9108)) or None  # Prometheus text endpoint at /metrics; 0 to disable
+BLOCKING_WATCHDOG_THRESHOLD = None  # seconds; e.g. 0.1 to log callbacks that hold the event loop longer
+MAX_PROFILE_SECONDS = 60
+# Sharding: leave both unset to run every shard in this process. To split shards
+# across processes, give each process the total and its own ids, e.g.
+# SHARD_COUNT=4 SHARD_IDS=0,1 in one and SHARD_COUNT=4 SHARD_IDS=2,3 in another.
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 0)) or None
+SHARD_IDS = [int(i) for i in os.environ['SHARD_IDS'].split(',')] if os.environ.get('SHARD_IDS') else None
+# Upstream caches and the event catalogue, saved on a timer and at shutdown and restored at startup
+SNAPSHOT_FILE = 'warm_start.snapshot' if SHARD_IDS is None else f"warm_start-{'-'.join(map(str, SHARD_IDS))}.snapshot"
+SNAPSHOT_INTERVAL = 10 * 60
+# JSON state files from older versions, imported into STATE_DB_FILE once
 ANNOUNCED_EVENTS_FILE = 'announced_events.json'
+ANNOUNCEMENT_LEDGER_FILE = 'announcement_ledger.jsonl'
 SERVER_CONFIG_FILE = 'server_config.json'
 CURRENT_CTFS_FILE = 'current_ctfs.json'
 
@@ -26,72 +65,85 @@ intents.message_content = True
 def get_prefix(bot, message):
     if not message.guild:
         return '!'  # Default prefix for DMs
-    with open(SERVER_CONFIG_FILE, 'r') as f:
-        server_config = json.load(f)
-    return server_config.get(str(message.guild.id), {}).get('prefix', '!')
-
-bot = commands.Bot(command_prefix=get_prefix, intents=intents, help_command=None)
+    return load_server_config().get(str(message.guild.id), {}).get('prefix', '!')
+
+class CTFBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        self.add_dynamic_items(PageButton)
+        await load_snapshot()
+        save_snapshot_periodically.start()
+        await metrics_server.start()
+        if BLOCKING_WATCHDOG_THRESHOLD is not None:
+            watchdog.start()
+
+    async def close(self):
+        status_scheduler.stop()
+        watchdog.stop()
+        await metrics_server.stop()
+        await cluster.stop()
+        save_snapshot_periodically.cancel()
+        await save_snapshot()
+        await ctftime.close()
+        await super().close()
+        store.close()
+
+bot = CTFBot(command_prefix=get_prefix, intents=intents, help_command=None,
+             shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
+watchdog = BlockingWatchdog(BLOCKING_WATCHDOG_THRESHOLD or 0.1)
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    outcome = "error" if ctx.command_failed else "ok"
+    metrics.command_latency.observe((ctx.command.qualified_name, outcome), time.perf_counter() - ctx.started_at)
 
 start_time = datetime.now(timezone.utc)
 
+store = Storage(STATE_DB_FILE)
+dispatcher = DeliveryDispatcher()
+catalogue = EventCatalogue()
+team_index = TeamIndex()
+event_sync = EventSync()
+poller = AdaptivePoller(MIN_POLL_INTERVAL, MAX_POLL_INTERVAL)
+store.import_json_files(SERVER_CONFIG_FILE, ANNOUNCEMENT_LEDGER_FILE, ANNOUNCED_EVENTS_FILE, CURRENT_CTFS_FILE)
+
+# guild id (str) -> settings, loaded from the database once and kept in memory
+server_config_cache = None
+
 def load_server_config():
-    if not os.path.exists(SERVER_CONFIG_FILE):
-        with open(SERVER_CONFIG_FILE, 'w') as f:
-            json.dump({}, f)
-    with open(SERVER_CONFIG_FILE, 'r') as f:
-        return json.load(f)
-
-def save_server_config(config):
-    with open(SERVER_CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=4)
-
-def load_announced_events():
-    if not os.path.exists(ANNOUNCED_EVENTS_FILE):
-        with open(ANNOUNCED_EVENTS_FILE, 'w') as f:
-            json.dump({"announced_event_ids": []}, f)
-    with open(ANNOUNCED_EVENTS_FILE, 'r') as f:
-        data = json.load(f)
-    return set(data.get("announced_event_ids", []))
-
-def save_announced_events(announced_event_ids):
-    with open(ANNOUNCED_EVENTS_FILE, 'w') as f:
-        json.dump({"announced_event_ids": list(announced_event_ids)}, f, indent=4)
-
-def get_ctftime_events():
-    try:
-        headers = {
-            "User-Agent": "DiscordBot (https://yourbotwebsite.com, v1.0)"
-        }
-        now = datetime.now(timezone.utc)
-        start = int(now.timestamp())
-        finish = int((now + timedelta(days=7)).timestamp())
-        params = {
-            "limit": 100,
-            "start": start,
-            "finish": finish
-        }
-        response = requests.get(CTFTIME_API_EVENTS, params=params, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error fetching CTFtime events: {response.status_code}")
-            return []
-    except Exception as e:
-        print(f"Error occurred while fetching events: {e}")
-        return []
+    """Return the in-memory server config, reading the database only on first use"""
+    global server_config_cache
+    if server_config_cache is None:
+        server_config_cache = store.load_guild_settings()
+    return server_config_cache
+
+def reload_server_config():
+    global server_config_cache
+    server_config_cache = None
+
+def update_server_config(server_id, key, value):
+    """Update a single guild setting in memory and write it through to the database"""
+    load_server_config().setdefault(str(server_id), {})[key] = value
+    store.set_guild_setting(server_id, key, value)
+
+def create_ctf_embed(event, start_dt=None, end_dt=None):
+    if start_dt is None:
+        start_dt = datetime.fromisoformat(event["start"].replace("Z", "+00:00"))
+    if end_dt is None:
+        end_dt = datetime.fromisoformat(event["finish"].replace("Z", "+00:00"))
 
-def create_ctf_embed(event):
     embed = discord.Embed(
         title=event["title"],
         description=event.get("description", "No description provided."),
         url=event["ctftime_url"],
         color=discord.Color.blue(),
-        timestamp=datetime.fromisoformat(event["start"].replace("Z", "+00:00"))
+        timestamp=start_dt
     )
 
-    start_dt = datetime.fromisoformat(event["start"].replace("Z", "+00:00"))
-    end_dt = datetime.fromisoformat(event["finish"].replace("Z", "+00:00"))
-
     start_unix = int(start_dt.timestamp())
     end_unix = int(end_dt.timestamp())
 
@@ -123,91 +175,62 @@ def create_ctf_embed(event):
 
     return embed
 
-def get_top_teams(year=None, limit=10):
-    try:
-        url = CTFTIME_API_TOP_TEAMS
-        if year:
-            url += f"{year}/"
-        headers = {
-            "User-Agent": "DiscordBot (https://yourbotwebsite.com, v1.0)"
-        }
-        params = {"limit": limit}
-        response = requests.get(url, params=params, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error fetching top teams: {response.status_code}")
-            return {}
-    except Exception as e:
-        print(f"Error occurred while fetching top teams: {e}")
-        return {}
-
-
-class TopTeamsPaginator(View):
-    def __init__(self, teams, year, limit):
-        super().__init__(timeout=60)  
-        self.teams = teams
-        self.year = year
-        self.limit = limit
-        self.current_page = 0
-        self.teams_per_page = 10 
-
-    @discord.ui.button(label="Previous", style=ButtonStyle.grey)
-    async def previous_button(self, interaction: discord.Interaction, button: Button):
-        if self.current_page > 0:
-            self.current_page -= 1
-            await interaction.response.edit_message(embed=self.create_embed())
-
-    @discord.ui.button(label="Next", style=ButtonStyle.grey)
-    async def next_button(self, interaction: discord.Interaction, button: Button):
-        if (self.current_page + 1) * self.teams_per_page < self.limit:
-            self.current_page += 1
-            await interaction.response.edit_message(embed=self.create_embed())
-
-    def create_embed(self):
-        start_idx = self.current_page * self.teams_per_page
-        end_idx = start_idx + self.teams_per_page
-        current_teams = self.teams[start_idx:end_idx]
+class RenderedEvent:
+    """An event's announcement embed and parsed times, built once and shared by every guild"""
 
-        embed = discord.Embed(
-            title=f"Top CTF Teams for {self.year}",
-            color=discord.Color.purple(),
-            timestamp=datetime.now(timezone.utc)
-        )
+    def __init__(self, content_hash, start_time, end_time, embed):
+        self.content_hash = content_hash
+        self.start_time = start_time
+        self.end_time = end_time
+        self.embed = embed
 
-        for idx, team in enumerate(current_teams, start=start_idx + 1):
-            embed.add_field(
-                name=f"{idx}. {team['team_name']}",
-                value=f"Points: {team['points']:.2f} | Team ID: {team['team_id']}",
-                inline=False
-            )
+# event id -> RenderedEvent, rebuilt only when the event's content hash changes
+rendered_events = {}
+# (ctf id, status) -> (content hash, status embed)
+rendered_status_embeds = {}
 
-        total_pages = (self.limit - 1) // self.teams_per_page + 1
-        embed.set_footer(text=f"Page {self.current_page + 1} of {total_pages} | Data from CTFtime.org")
-        return embed
-    
-def load_current_ctfs():
-    if not os.path.exists(CURRENT_CTFS_FILE):
-        with open(CURRENT_CTFS_FILE, 'w') as f:
-            json.dump({"current_ctfs": []}, f)
-    with open(CURRENT_CTFS_FILE, 'r') as f:
-        data = json.load(f)
-        if not isinstance(data, dict) or "current_ctfs" not in data or not isinstance(data["current_ctfs"], list):
-            data = {"current_ctfs": []}
-            save_current_ctfs(data)
-        return data
-
-
-def save_current_ctfs(ctfs):
-    with open(CURRENT_CTFS_FILE, 'w') as f:
-        json.dump({"current_ctfs": ctfs}, f, indent=4)
+def content_hash(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+def render_event(event):
+    digest = content_hash(event)
+    rendered = rendered_events.get(event["id"])
+    if rendered is not None and rendered.content_hash == digest:
+        return rendered
+
+    start_dt = datetime.fromisoformat(event["start"].replace("Z", "+00:00"))
+    end_dt = datetime.fromisoformat(event["finish"].replace("Z", "+00:00"))
+    rendered = RenderedEvent(
+        digest,
+        int(start_dt.timestamp()),
+        int(end_dt.timestamp()),
+        create_ctf_embed(event, start_dt, end_dt)
+    )
+    rendered_events[event["id"]] = rendered
+    return rendered
+
+def get_ctf_status_embed(ctf, status):
+    """Return the cached status embed for a tracked CTF, rendering it if the CTF changed"""
+    # str() so rows read back from SQLite hash the same as freshly built ones
+    digest = content_hash([str(ctf[column]) for column in CTF_COLUMNS])
+    cached = rendered_status_embeds.get((ctf["id"], status))
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+
+    embed = create_ctf_status_embed(ctf, status)
+    rendered_status_embeds[(ctf["id"], status)] = (digest, embed)
+    return embed
+
+def forget_rendered(ctf_id):
+    rendered_events.pop(ctf_id, None)
+    for status in ("started", "ended"):
+        rendered_status_embeds.pop((ctf_id, status), None)
 
 async def store_ctf_timing(event):
     """Store CTF timing information when a new event is announced"""
-    current_ctfs = load_current_ctfs()
-
-    start_time = int(datetime.fromisoformat(event["start"].replace("Z", "+00:00")).timestamp())
-    end_time = int(datetime.fromisoformat(event["finish"].replace("Z", "+00:00")).timestamp())
+    rendered = render_event(event)
+    start_time = rendered.start_time
+    end_time = rendered.end_time
 
     ctf_info = {
         "id": event["id"],
@@ -219,12 +242,20 @@ async def store_ctf_timing(event):
         "ctftime_url": event["ctftime_url"],
         "logo": event.get("logo", "https://ctftime.org/static/images/logo.png"),
         "format": event["format"],
-        "weight": event.get("weight", "N/A"),
-        "announcement_message_id": None
+        "weight": event.get("weight", "N/A")
     }
 
-    current_ctfs["current_ctfs"].append(ctf_info)
-    save_current_ctfs(current_ctfs)
+    stale = store.track_ctf(ctf_info)
+    status_scheduler.arm(event["id"], start_time, end_time)
+    if stale:
+        # Postponed after its "started" notice; take that down, a new one follows at the new start
+        if SHARD_IDS is not None:
+            cluster.publish("status", {"starting": [], "records": stale})
+        await deliver_status_updates([], stale)
+    if SHARD_IDS is not None and not cluster.is_leader:
+        # The leader runs the status scheduler; tell it about the CTF instead of having it poll the table
+        cluster.publish("tracked", {"id": event["id"], "start_time": start_time, "end_time": end_time})
+    get_ctf_status_embed(ctf_info, "started")
 
 def create_ctf_status_embed(ctf, status="started"):
     """Create embed for general CTF status announcements"""
@@ -234,7 +265,7 @@ def create_ctf_status_embed(ctf, status="started"):
         title=f"CTF {status.title()}! - {ctf['title']}",
         url=ctf['ctftime_url'],
         color=color,
-        timestamp=datetime.now(timezone.utc)
+        timestamp=datetime.fromtimestamp(ctf["start_time"] if status == "started" else ctf["end_time"], timezone.utc)
     )
 
     start_time = ctf["start_time"]
@@ -264,200 +295,536 @@ def create_ctf_status_embed(ctf, status="started"):
 @has_permissions(manage_guild=True)
 async def set_current_ctf_channel(ctx, channel: discord.TextChannel):
     """Set the channel for CTF status announcements"""
-    config = load_server_config()
-    server_id = str(ctx.guild.id)
-    if server_id not in config:
-        config[server_id] = {}
-    config[server_id]['current_ctf_channel_id'] = channel.id
-    save_server_config(config)
+    update_server_config(ctx.guild.id, 'current_ctf_channel_id', channel.id)
 
     await ctx.send(f"Current CTF status channel has been set to {channel.mention}")
 
-async def post_ctf_events(specific_server_id=None, message=None):
-    config = load_server_config()
-    events_found = False
+def owns_guild(server_id):
+    """Whether this process runs the shard a guild is on; always True unless shards are split"""
+    return SHARD_IDS is None or shard_for_guild(server_id, SHARD_COUNT) in SHARD_IDS
 
-    for server_id, server_config in config.items():
+def get_guild_channels(setting, specific_server_id=None):
+    """Resolve the channel stored under `setting` for every guild on this process's shards as (server_id, channel) pairs"""
+    targets = []
+    for server_id, server_config in load_server_config().items():
         if specific_server_id and str(specific_server_id) != server_id:
             continue
+        if not owns_guild(server_id):
+            continue
 
-        announcement_channel_id = server_config.get('announcement_channel_id')
-        if announcement_channel_id:
-            channel = bot.get_channel(announcement_channel_id)
-            if channel is None:
-                print(f"Announcement channel with ID {announcement_channel_id} not found for server {server_id}.")
-                continue
+        channel_id = server_config.get(setting)
+        if not channel_id:
+            continue
 
-            announced_event_ids = load_announced_events()
-            events = get_ctftime_events()
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            print(f"Channel with ID {channel_id} ({setting}) not found for server {server_id}.")
+            continue
 
-            new_events = []
-            for event in events:
-                event_id = event["id"]
-                if event_id not in announced_event_ids:
-                    new_events.append(event)
-                    announced_event_ids.add(event_id)
+        targets.append((server_id, channel))
+    return targets
 
-                    await store_ctf_timing(event)
+def create_ctf_digest_embed(event_embeds):
+    """Summarise several create_ctf_embed results as one field per event"""
+    embed = discord.Embed(
+        title=f"{len(event_embeds)} New CTF Events",
+        color=discord.Color.blue(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    for event_embed in event_embeds:
+        fields = {field.name: field.value for field in event_embed.fields}
+        embed.add_field(
+            name=event_embed.title[:256],
+            value=f"[CTFtime]({event_embed.url}) | Start: {fields['Start']}\n"
+                  f"Format: {fields['Format']} | Weight: {fields['Weight']}",
+            inline=False
+        )
+    embed.set_footer(text="Data from CTFtime.org")
+    return embed
 
-            if not new_events:
-                print(f"No new CTF events to announce for server {server_id}.")
-                continue
+def pack_embeds(items):
+    """Pack (events, embed) items into messages within Discord's 10 embeds / 6000 characters limits.
+
+    Returns a list of (events, embeds) pairs, one per message to send.
+    """
+    messages = []
+    events, embeds, size = [], [], 0
+    for item_events, embed in items:
+        if embeds and (len(embeds) == MAX_EMBEDS_PER_MESSAGE or size + len(embed) > MAX_EMBED_CHARS_PER_MESSAGE):
+            messages.append((events, embeds))
+            events, embeds, size = [], [], 0
+        events = events + item_events
+        embeds.append(embed)
+        size += len(embed)
+    if embeds:
+        messages.append((events, embeds))
+    return messages
+
+def build_announcement_messages(new_events, embeds, digest=False):
+    """Group a guild's new events into as few messages as possible"""
+    if not digest:
+        return pack_embeds([([event], embeds[event["id"]]) for event in new_events])
+
+    items = []
+    for i in range(0, len(new_events), DIGEST_EVENTS_PER_EMBED):
+        chunk = new_events[i:i + DIGEST_EVENTS_PER_EMBED]
+        items.append((chunk, create_ctf_digest_embed([embeds[event["id"]] for event in chunk])))
+    return pack_embeds(items)
+
+def create_ctf_update_embed(event, old_event=None):
+    """Notice for an announced event that was rescheduled (old_event given) or dropped from CTFtime"""
+    if old_event is None:
+        embed = discord.Embed(
+            title=f"CTF Cancelled or Moved - {event['title']}",
+            url=event['ctftime_url'],
+            description="This event is no longer listed on CTFtime at its announced time. It may have been cancelled or moved.",
+            color=discord.Color.dark_grey(),
+            timestamp=datetime.now(timezone.utc)
+        )
+    else:
+        rendered = render_event(event)
+        old_start = int(datetime.fromisoformat(old_event["start"].replace("Z", "+00:00")).timestamp())
+        embed = discord.Embed(
+            title=f"CTF Rescheduled - {event['title']}",
+            url=event['ctftime_url'],
+            description=(
+                f"Now starts <t:{rendered.start_time}:F> (<t:{rendered.start_time}:R>) "
+                f"and ends <t:{rendered.end_time}:F>.\n"
+                f"Previously started <t:{old_start}:F>."
+            ),
+            color=discord.Color.orange(),
+            timestamp=datetime.now(timezone.utc)
+        )
+    embed.set_footer(text="Data from CTFtime.org")
+    return embed
 
-            events_found = True
-            for event in new_events:
-                embed = create_ctf_embed(event)
-                try:
-                    await channel.send(embed=embed)
-                    print(f"Announced event: {event['title']} in server {server_id}")
-                except Exception as e:
-                    print(f"Failed to send embed for event {event['title']} in server {server_id}: {e}")
+def update_catalogue(delta):
+    for event in delta.added:
+        catalogue.add(event)
+    for old_event, event in delta.changed:
+        catalogue.add(event)
+    for event in delta.removed:
+        if event["id"] in catalogue.events:
+            catalogue.remove(event["id"])
+    catalogue.refresh([], int(datetime.now(timezone.utc).timestamp()))
+    if delta.changed or delta.removed:
+        dashboard_updates.trigger()
+
+async def apply_event_delta(delta):
+    """Push a sync delta into CTF tracking, the status scheduler and the catalogue"""
+    for old_event, event in delta.changed:
+        if event["id"] in status_scheduler.armed:
+            await store_ctf_timing(event)  # upserts the row and re-arms the new times
+    for event in delta.removed:
+        store.remove_ctfs([event["id"]])
+        status_scheduler.forget(event["id"])
+        forget_rendered(event["id"])
+    update_catalogue(delta)
+
+# guild id -> end of the look-ahead window its announcement channel was last fully
+# diffed against. Later syncs only need the added and changed events plus those that have
+# moved into the guild's horizon since then.
+synced_guilds = {}
+# Held for each sync and announcement: overlapping runs would both see the same
+# events as undelivered and post them twice
+announce_lock = asyncio.Lock()
+
+def guild_horizon_days(server_id):
+    return load_server_config().get(str(server_id), {}).get('horizon_days', DEFAULT_HORIZON_DAYS)
+
+def sync_horizon_days():
+    """The widest look-ahead any guild with an announcement channel wants"""
+    horizons = [
+        server_config.get('horizon_days', DEFAULT_HORIZON_DAYS)
+        for server_config in load_server_config().values() if server_config.get('announcement_channel_id')
+    ]
+    return max(horizons, default=DEFAULT_HORIZON_DAYS)
 
-            save_announced_events(announced_event_ids)
+async def post_ctf_events(specific_server_id=None, message=None):
+    """Sync events, apply the delta, then fan new events and schedule changes out to each guild.
+
+    A sync uses up its delta, so it is always announced to every guild, even
+    when one guild asked for it; that guild just gets a full catch-up. Returns
+    whether the asking guild (or, without one, any guild) got new events.
+    """
+    async with announce_lock:
+        if specific_server_id is not None:
+            synced_guilds.pop(str(specific_server_id), None)
+
+        if SHARD_IDS is not None and not cluster.is_leader:
+            # Only the leader syncs; catch the guild up from the last window it sent
+            last = event_sync.last_delta
+            delta = EventDelta(last.events if last else [], [], [], [], False)
+            announced = await announce_delta(delta, specific_server_id)
+        else:
+            delta = await event_sync.sync(sync_horizon_days())
+            await apply_event_delta(delta)
+            if delta:
+                print(f"Event sync: {delta.summary()}")
+            if SHARD_IDS is not None:
+                # Guilds on other processes' shards are announced to by those processes
+                cluster.publish("events", {
+                    "events": delta.events,
+                    "added": [event["id"] for event in delta.added],
+                    "changed": [[old_event, event["id"]] for old_event, event in delta.changed],
+                    "removed": delta.removed,
+                    "complete": delta.complete
+                })
+            announced = await announce_delta(delta)
+
+    if specific_server_id is not None:
+        return str(specific_server_id) in announced
+    return bool(announced)
+
+async def receive_event_delta(payload):
+    """Cluster handler: announce a delta the leader synced to this process's guilds"""
+    events = {event["id"]: event for event in payload["events"]}
+    delta = EventDelta(
+        payload["events"],
+        [events[event_id] for event_id in payload["added"]],
+        [(old_event, events[event_id]) for old_event, event_id in payload["changed"]],
+        payload["removed"],
+        payload["complete"]
+    )
+    update_catalogue(delta)
+    event_sync.last_delta = delta
+    async with announce_lock:
+        await announce_delta(delta)
+
+async def announce_delta(delta, specific_server_id=None):
+    """Announce new events, and reschedules/cancellations of announced ones, to this process's guilds.
+
+    Returns the ids of the guilds that were sent new events.
+    """
+    targets = get_guild_channels('announcement_channel_id', specific_server_id)
+    if specific_server_id is None:
+        # A guild whose channel did not resolve missed this delta; give it a full catch-up next time
+        for server_id in set(synced_guilds) - {server_id for server_id, channel in targets}:
+            del synced_guilds[server_id]
+    if not targets:
+        return set()
+
+    embeds = {}
+    end_times = {}  # captured now: check_ctf_status may forget the rendering while deliveries are in flight
+    jobs = []
+    config = load_server_config()
+    now = int(datetime.now(timezone.utc).timestamp())
+    horizon_ends = {}
+    starts = {event["id"]: event_start(event) for event in delta.events}
+    # Changed events too: a reschedule can move an event this guild has never seen into its horizon
+    fresh = {event["id"] for event in delta.added} | {event["id"] for old_event, event in delta.changed}
+    # (digest mode, new event ids) -> packed messages; most guilds share the same new events
+    packed = {}
+
+    for server_id, channel in targets:
+        horizon_end = horizon_ends[server_id] = now + guild_horizon_days(server_id) * 24 * 60 * 60
+        covered = synced_guilds.get(server_id)
+        if covered is None:
+            candidates = [event for event in delta.events if starts[event["id"]] < horizon_end]
+        else:
+            candidates = [
+                event for event in delta.events
+                if starts[event["id"]] < horizon_end and (event["id"] in fresh or starts[event["id"]] >= covered)
+            ]
+        delivered = store.delivered_event_ids(server_id, [event["id"] for event in candidates])
+        new_events = [event for event in candidates if event["id"] not in delivered]
+        if not new_events:
+            continue
 
-    return events_found
+        for event in new_events:
+            if event["id"] not in embeds:
+                await store_ctf_timing(event)
+                rendered = render_event(event)
+                embeds[event["id"]] = rendered.embed
+                end_times[event["id"]] = rendered.end_time
+
+        digest = config[server_id].get('announcement_mode') == 'digest'
+        pack_key = (digest, tuple(event["id"] for event in new_events))
+        if pack_key not in packed:
+            packed[pack_key] = build_announcement_messages(new_events, embeds, digest)
+        for batch_events, batch_embeds in packed[pack_key]:
+            send = lambda channel=channel, batch_embeds=batch_embeds: channel.send(embeds=batch_embeds)
+            jobs.append(DeliveryJob(server_id, channel.id, send, batch_events))
+
+    # Tell guilds that already got an event when it is rescheduled or disappears
+    updates = [(event, old_event) for old_event, event in delta.changed
+               if (old_event["start"], old_event["finish"]) != (event["start"], event["finish"])]
+    updates += [(event, None) for event in delta.removed]
+    recipients = store.event_recipients(event["id"] for event, old_event in updates)
+    channels = dict(targets)
+    for event, old_event in updates:
+        embed = create_ctf_update_embed(event, old_event)
+        for server_id in recipients.get(event["id"], ()):
+            channel = channels.get(server_id)
+            if channel is not None:
+                send = lambda channel=channel, embed=embed: channel.send(embed=embed)
+                jobs.append(DeliveryJob(server_id, channel.id, send))
+
+    report = await dispatcher.dispatch(jobs, "announcements")
+    if jobs:
+        print(report.summary())
+
+    deliveries = []
+    for job in report.jobs:
+        if job.ok and job.context is not None:
+            for event in job.context:
+                deliveries.append((job.server_id, event["id"], end_times[event["id"]]))
+
+    store.record_deliveries(deliveries)
+    store.prune_deliveries(int((datetime.now(timezone.utc) - LEDGER_RETENTION).timestamp()))
+
+    failed = {job.server_id for job in report.jobs if not job.ok}
+    for server_id, channel in targets:
+        if server_id in failed:
+            synced_guilds.pop(server_id, None)
+        else:
+            synced_guilds[server_id] = horizon_ends[server_id]
+
+    for event_id in [event_id for event_id, rendered in rendered_events.items() if rendered.end_time < now]:
+        del rendered_events[event_id]
+
+    if not embeds:
+        print("No new CTF events to announce.")
+    return {job.server_id for job in report.jobs if job.ok and job.context is not None}
+
+async def delete_status_message(channel, message_id):
+    try:
+        message = await channel.fetch_message(message_id)
+        await message.delete()
+    except discord.NotFound:
+        print("Message not found, it may have been deleted manually.")
+    except discord.Forbidden:
+        print("Bot does not have permission to delete messages in this channel.")
 
 async def check_ctf_status():
     try:
         current_time = int(datetime.now(timezone.utc).timestamp())
-        ctfs_data = load_current_ctfs()
-        config = load_server_config()
-
-        for server_id, server_config in config.items():
-            current_ctf_channel_id = server_config.get('current_ctf_channel_id')
-            if not current_ctf_channel_id:
-                continue
-
-            channel = bot.get_channel(current_ctf_channel_id)
-            if not channel:
-                print(f"Current CTF channel with ID {current_ctf_channel_id} not found for server {server_id}.")
-                continue
-
-            updated_ctfs = []
-
-            for ctf in ctfs_data["current_ctfs"]:
-                if current_time >= ctf["start_time"] and not ctf["announcement_message_id"]:
-                    embed = create_ctf_status_embed(ctf, "started")
-                    message = await channel.send(embed=embed)
-                    ctf["announcement_message_id"] = message.id  
-
-                elif current_time >= ctf["end_time"] and ctf["announcement_message_id"]:
-                    try:
-                        message = await channel.fetch_message(ctf["announcement_message_id"])
-                        await message.delete()
-                    except discord.NotFound:
-                        print("Message not found, it may have been deleted manually.")
-                    except discord.Forbidden:
-                        print("Bot does not have permission to delete messages in this channel.")
-                    
-                    ctf["announcement_message_id"] = None
-
-                if current_time < ctf["end_time"]:
-                    updated_ctfs.append(ctf)
-
-            ctfs_data["current_ctfs"] = updated_ctfs
-            save_current_ctfs(ctfs_data)
+        starting = store.ctfs_starting(current_time)
+        ending = store.ctfs_ending(current_time)
+        if not starting and not ending:
+            return
+
+        records = store.status_messages(ctf["id"] for ctf in ending)
+        if SHARD_IDS is not None:
+            # Ship the message records too: the rows are gone by the time other processes act on this
+            cluster.publish("status", {"starting": starting, "records": records})
+        await deliver_status_updates(starting, records)
+
+        store.mark_started([ctf["id"] for ctf in starting])
+        store.remove_ctfs([ctf["id"] for ctf in ending])
+        for ctf in ending:
+            status_scheduler.forget(ctf["id"])
+            forget_rendered(ctf["id"])
 
     except Exception as e:
         print(f"Error in check_ctf_status: {e}")
 
+async def receive_status_updates(payload):
+    """Cluster handler: post and delete status messages in this process's guilds"""
+    await deliver_status_updates(payload["starting"], payload["records"])
 
-def get_team_info(team_id):
-    try:
-        url = f"{CTFTIME_API_TEAM_INFO}{team_id}/"
-        headers = {
-            "User-Agent": "DiscordBot (https://yourbotwebsite.com, v1.0)"
-        }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error fetching team info: {response.status_code}")
-            return {}
-    except Exception as e:
-        print(f"Error occurred while fetching team info: {e}")
-        return {}
+async def deliver_status_updates(starting, records):
+    """Post "started" messages for `starting` CTFs and delete the status messages in `records`"""
+    # Dashboard guilds get one debounced edit instead of a message per CTF
+    config = load_server_config()
+    channels = [
+        (server_id, channel) for server_id, channel in get_guild_channels('current_ctf_channel_id')
+        if config[server_id].get('status_mode') != 'dashboard'
+    ]
+    dashboard_updates.trigger()
+
+    jobs = []
+    for ctf in starting:
+        embed = get_ctf_status_embed(ctf, "started")
+        for server_id, channel in channels:
+            send = lambda channel=channel, embed=embed: channel.send(embed=embed)
+            jobs.append(DeliveryJob(server_id, channel.id, send, ctf))
+
+    for record in records:
+        channel = bot.get_channel(record["channel_id"]) if owns_guild(record["guild_id"]) else None
+        if channel is None:
+            continue
+        send = lambda channel=channel, message_id=record["message_id"]: delete_status_message(channel, message_id)
+        jobs.append(DeliveryJob(record["guild_id"], channel.id, send))
 
-def get_top_teams_by_country(country_code):
-    try:
-        url = f"{CTFTIME_API_TOP_BY_COUNTRY}{country_code}/"
-        headers = {
-            "User-Agent": "DiscordBot (https://yourbotwebsite.com, v1.0)"
-        }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error fetching top teams by country: {response.status_code}")
-            return []
-    except Exception as e:
-        print(f"Error occurred while fetching top teams by country: {e}")
-        return []
-
-class TeamPaginator(View):
-    def __init__(self, teams, country_code):
-        super().__init__(timeout=60)
-        self.teams = teams
-        self.country_code = country_code
-        self.current_page = 0
-        self.teams_per_page = 10
-
-    @discord.ui.button(label="Previous", style=ButtonStyle.grey)
-    async def previous_button(self, interaction: discord.Interaction, button: Button):
-        if self.current_page > 0:
-            self.current_page -= 1
-            await interaction.response.edit_message(embed=self.create_embed())
-
-    @discord.ui.button(label="Next", style=ButtonStyle.grey)
-    async def next_button(self, interaction: discord.Interaction, button: Button):
-        if (self.current_page + 1) * self.teams_per_page < len(self.teams):
-            self.current_page += 1
-            await interaction.response.edit_message(embed=self.create_embed())
-
-    def create_embed(self):
-        start_idx = self.current_page * self.teams_per_page
-        end_idx = start_idx + self.teams_per_page
-        current_teams = self.teams[start_idx:end_idx]
+    report = await dispatcher.dispatch(jobs, "status updates")
+    if jobs:
+        print(report.summary())
 
-        embed = discord.Embed(
-            title=f"Top CTF Teams for {self.country_code.upper()}",
-            color=discord.Color.teal(),
-            timestamp=datetime.now(timezone.utc)
-        )
+    store.add_status_messages([
+        (job.server_id, job.context["id"], job.channel_id, job.result.id)
+        for job in report.jobs if job.ok and job.context is not None
+    ])
 
-        for team in current_teams:
-            embed.add_field(
-                name=f"{team['country_place']}. {team['team_name']}",
-                value=f"Global Rank: {team['place']}\nPoints: {team['points']:.2f}\nEvents: {team['events']}",
-                inline=False
-            )
+def create_ctf_dashboard_embed(running):
+    """One embed listing every running CTF with a live countdown to its end"""
+    embed = discord.Embed(
+        title="Running CTFs",
+        color=discord.Color.green(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    if not running:
+        embed.description = "No CTFs are running right now."
+    for ctf in running[:MAX_DASHBOARD_CTFS]:
+        embed.add_field(
+            name=ctf["title"][:256],
+            value=f"Ends <t:{ctf['end_time']}:R> (<t:{ctf['end_time']}:F>)\n"
+                  f"Format: {ctf['format']} | Weight: {ctf['weight']} | [CTFtime]({ctf['ctftime_url']})",
+            inline=False
+        )
+    if len(running) > MAX_DASHBOARD_CTFS:
+        embed.description = f"Showing the {MAX_DASHBOARD_CTFS} ending soonest of {len(running)} running CTFs."
+    embed.set_footer(text="Updated when a CTF starts or ends | Data from CTFtime.org")
+    return embed
 
-        total_pages = (len(self.teams) - 1) // self.teams_per_page + 1
-        embed.set_footer(text=f"Page {self.current_page + 1} of {total_pages} | Data from CTFtime.org")
-        return embed
-    
-def calculate_rating(weight, total_teams, best_points, team_place, team_points):
+async def upsert_dashboard(server_id, channel, embed):
+    """Edit the guild's dashboard message in place, or post and pin a new one if it is gone"""
+    stored = load_server_config().get(server_id, {}).get('dashboard_message')
+    if stored and stored[0] == channel.id:
+        try:
+            return await channel.get_partial_message(stored[1]).edit(embed=embed)
+        except discord.NotFound:
+            pass
 
-    points_coef = team_points / best_points if best_points > 0 else 0
+    message = await channel.send(embed=embed)
+    try:
+        await message.pin()
+    except discord.HTTPException as e:
+        print(f"Could not pin the CTF dashboard in server {server_id}: {e}")
+    update_server_config(server_id, 'dashboard_message', [channel.id, message.id])
+    return message
+
+# guild id -> hash of the running CTFs its dashboard message currently shows
+dashboard_hashes = {}
+
+async def update_dashboards():
+    """Re-render the running CTFs dashboard and edit it in every guild whose copy is out of date"""
+    running = store.running_ctfs(int(datetime.now(timezone.utc).timestamp()))
+    digest = content_hash([[str(ctf[column]) for column in CTF_COLUMNS] for ctf in running])
+    embed = None
+
+    jobs = []
+    config = load_server_config()
+    for server_id, channel in get_guild_channels('current_ctf_channel_id'):
+        if config[server_id].get('status_mode') != 'dashboard' or dashboard_hashes.get(server_id) == digest:
+            continue
+        embed = embed or create_ctf_dashboard_embed(running)
+        send = lambda server_id=server_id, channel=channel: upsert_dashboard(server_id, channel, embed)
+        jobs.append(DeliveryJob(server_id, channel.id, send))
+
+    report = await dispatcher.dispatch(jobs, "dashboards")
+    if jobs:
+        print(report.summary())
+    for job in report.jobs:
+        if job.ok:
+            dashboard_hashes[job.server_id] = digest
+
+dashboard_updates = Debouncer(update_dashboards, DASHBOARD_DEBOUNCE)
+
+# Wakes check_ctf_status exactly at the next tracked CTF start or end
+status_scheduler = DeadlineScheduler(check_ctf_status)
+
+def start_status_scheduler():
+    for ctf in store.tracked_ctfs():
+        status_scheduler.arm(ctf["id"], ctf["start_time"], ctf["end_time"], started=bool(ctf["started"]))
+    status_scheduler.start()
+
+def start_leader_duties():
+    if not fetch_events_periodically.is_running():
+        fetch_events_periodically.start()
+    start_status_scheduler()
+
+def stop_leader_duties():
+    fetch_events_periodically.cancel()
+    status_scheduler.stop()
+
+async def on_leader_change(leader):
+    if leader:
+        start_leader_duties()
+    else:
+        stop_leader_duties()
+
+async def receive_tracked_ctf(payload):
+    """Cluster handler: arm a CTF another process started tracking"""
+    if cluster.is_leader:
+        status_scheduler.arm(payload["id"], payload["start_time"], payload["end_time"])
+
+# Only used when SHARD_IDS splits the shards across processes
+cluster = Cluster(
+    store,
+    {"events": receive_event_delta, "status": receive_status_updates, "tracked": receive_tracked_ctf},
+    on_leader_change=on_leader_change
+)
 
-    place_coef = 1 / team_place if team_place > 0 else 0
+def load_team_index():
+    for team_id, name in store.load_team_names():
+        team_index.add(team_id, name)
+
+def index_teams(teams):
+    """ctftime team listener: add any names not seen before and persist just those"""
+    new_names = [(team_id, name) for team_id, name in teams if team_index.add(team_id, name)]
+    if new_names:
+        store.add_team_names(new_names)
+
+load_team_index()
+ctftime.team_listeners.append(index_teams)
+
+def seed_catalogue():
+    """Fill the catalogue from tracked CTFs so running events are known before the first fetch"""
+    for ctf in store.tracked_ctfs():
+        if ctf["id"] not in catalogue.events:
+            catalogue.add(dict(ctf), ctf["start_time"], ctf["end_time"])
+
+async def load_snapshot():
+    """Warm the CTFtime caches, the catalogue and the event sync from the last snapshot.
+
+    Restored cache entries keep their age, so old ones are served at once and
+    revalidated in the background, and the first event sync is a conditional
+    request that only reports what changed while the bot was down.
+    """
+    started = time.perf_counter()
+    state = await asyncio.get_running_loop().run_in_executor(None, read_snapshot, SNAPSHOT_FILE)
+    if state is None:
+        return
+    try:
+        ctftime.restore_state(state["ctftime"])
+        catalogue.restore(state["catalogue"], int(datetime.now(timezone.utc).timestamp()))
+        event_sync.restore(state["event_sync"])
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Error restoring snapshot: {e!r}")
+        return
+    entries = sum(len(cache.entries) for cache in ctftime.caches)
+    print(f"Warm start: {entries} cached responses and {len(catalogue)} events "
+          f"restored in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+async def save_snapshot():
+    state = {
+        "ctftime": ctftime.snapshot_state(),
+        "catalogue": catalogue.snapshot(),
+        "event_sync": event_sync.snapshot()
+    }
+    try:
+        # Cached values are never mutated in place, so encoding can run off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, write_snapshot, SNAPSHOT_FILE, state)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Error saving snapshot: {e!r}")
 
-    if points_coef > 0:
-        e_rating = ((points_coef + place_coef) * weight) / (1 / (1 + team_place/total_teams))
-        return e_rating
-    return 0
+@tasks.loop(seconds=SNAPSHOT_INTERVAL)
+async def save_snapshot_periodically():
+    if save_snapshot_periodically.current_loop > 0:  # the first run is at startup, right after loading
+        await save_snapshot()
 
 @bot.command(name='topcountryteams')
 async def top_country_teams_command(ctx, country_code: str):
     await ctx.send(f"Fetching top teams for country code: {country_code.upper()}...")
-    teams = get_top_teams_by_country(country_code.lower())
+    teams = await get_top_teams_by_country(country_code.lower())
     
     if not teams:
         await ctx.send(f"No data found or an error occurred while fetching top teams for country code: {country_code.upper()}")
         return
 
-    paginator = TeamPaginator(teams, country_code)
-    await ctx.send(embed=paginator.create_embed(), view=paginator)
+    embed, view = await TeamPaginator.show_page(country_code.lower(), 0)
+    await ctx.send(embed=embed, view=view)
 
 @bot.command(name='help')
 async def help_command(ctx):
@@ -471,22 +838,33 @@ async def help_command(ctx):
     embed.add_field(name=f"{prefix}test", value="Manually fetch and post the latest CTF events. (Requires Manage Server permission)", inline=False)
     embed.add_field(name=f"{prefix}topcountryteams [country_code]", value="Display ranked CTF teams for a specified country code, with pagination.", inline=False)
     embed.add_field(name=f"{prefix}topteams [year] [limit]", value="Display top CTF teams for a specified year. If year is omitted, current year is used. Limit defaults to 10.", inline=False)
-    embed.add_field(name=f"{prefix}team [team_id]", value="Display detailed information about a specific team by its ID.", inline=False)
+    embed.add_field(name=f"{prefix}upcoming [days] [filters]", value="List CTFs starting in the next few days (default 7). Filters: a format name, `onsite`, `online` or `weight>=N`.", inline=False)
+    embed.add_field(name=f"{prefix}running [filters]", value="List CTFs that are running right now.", inline=False)
+    embed.add_field(name=f"{prefix}events [YYYY-MM-DD] [YYYY-MM-DD] [filters]", value="List known CTFs taking place between two dates.", inline=False)
+    embed.add_field(name=f"{prefix}team [team_id or name]", value="Display detailed information about a specific team by its ID, or search for it by name or alias.", inline=False)
     embed.add_field(name=f"{prefix}uptime", value="Display how long the bot has been running.", inline=False)
+    embed.add_field(name=f"{prefix}cachestats", value="Show CTFtime cache hit rates, rate limiter and circuit breaker state. (Bot owner only)", inline=False)
+    embed.add_field(name=f"{prefix}stats", value="Show command latencies, CTFtime and Discord call stats, cache hit rates and event-loop lag. (Bot owner only)", inline=False)
+    embed.add_field(name=f"{prefix}watchdog [on|off] [threshold_ms]", value="Turn the blocking-callback watchdog on or off and show the call sites that held the event loop longest. (Bot owner only)", inline=False)
+    embed.add_field(name=f"{prefix}profile [seconds]", value=f"Sample the bot for up to {MAX_PROFILE_SECONDS} seconds and get a flame graph file back. (Bot owner only)", inline=False)
     embed.add_field(name=f"{prefix}setprefix [new_prefix]", value="Set a new prefix for the bot. (Requires Manage Server permission)", inline=False)
     embed.add_field(name=f"{prefix}setannouncementchannel [#channel]", value="Set the announcement channel for CTF events. (Requires Manage Server permission)", inline=False)
+    embed.add_field(name=f"{prefix}setannouncementmode [embeds|digest]", value="Announce new CTF events as full embeds (up to 10 per message) or as a compact digest. (Requires Manage Server permission)", inline=False)
+    embed.add_field(name=f"{prefix}sethorizon [days]", value="Announce CTFs starting up to this many days ahead (1-30, default 7). (Requires Manage Server permission)", inline=False)
     embed.add_field(name=f"{prefix}setcurrentctfchannel [#channel]", value="Set the channel for CTF status updates (start/end notifications). (Requires Manage Server permission)", inline=False)
-    embed.add_field(name=f"{prefix}rating [weight] [total_teams] [best_points] [team_place] [team_points]", value="Calculate the rating points of a particular team in an event using the [CTFtime rating formula.](https://ctftime.org/rating-formula/)", inline=False)
+    embed.add_field(name=f"{prefix}setstatusmode [messages|dashboard]", value="Post a message per CTF start, or keep one pinned message listing running CTFs that is edited in place. (Requires Manage Server permission)", inline=False)
+    embed.add_field(name=f"{prefix}rating [weight] [total_teams] [best_points] [team_place] [team_points]", value="Calculate the rating points of a particular team in an event using the [CTFtime rating formula.](https://ctftime.org/rating-formula/) Attach a CSV/JSON scoreboard and give only [weight] to rate every team at once.", inline=False)
     embed.set_footer(text="CTFtime Discord Bot")
     await ctx.send(embed=embed)
 
 @bot.command(name='test')
 @has_permissions(manage_guild=True)
 async def test_command(ctx):
-    message = await ctx.send("Fetching and posting the latest CTF events starting within a week...")
+    days = guild_horizon_days(ctx.guild.id)
+    message = await ctx.send(f"Fetching and posting the latest CTF events starting within {days} days...")
     events_found = await post_ctf_events(ctx.guild.id, message)
     if not events_found:
-        await message.edit(content="No new CTF events starting within a week.")
+        await message.edit(content=f"No new CTF events starting within {days} days.")
 
 @test_command.error
 async def test_command_error(ctx, error):
@@ -501,7 +879,9 @@ async def top_teams_command(ctx, year: int = None, limit: int = 10):
         await ctx.send("Limit must be at least 1.")
         return
     await ctx.send(f"Fetching top {limit} teams for the year {year}...")
-    data = get_top_teams(year=year, limit=limit)
+    # Larger leaderboards are paged in chunks, so only the first chunk is needed up front
+    fetch_limit = limit if limit <= 10 else TopTeamsPaginator.chunk_limit(limit, 0)
+    data = await get_top_teams(year=year, limit=fetch_limit)
     if not data:
         await ctx.send("No data found or an error occurred while fetching top teams.")
         return
@@ -511,16 +891,15 @@ async def top_teams_command(ctx, year: int = None, limit: int = 10):
         await ctx.send(f"No data available for the year {year}.")
         return
 
-    teams = data[year_str]
+    teams = data[year_str][:limit]
     if not teams:
         await ctx.send(f"No teams found for the year {year}.")
         return
 
     # If the total teams exceed teams_per_page, use paginator
     if limit > 10:
-        paginator = TopTeamsPaginator(teams, year, limit)
-        embed = paginator.create_embed()
-        await ctx.send(embed=embed, view=paginator)
+        embed, view = await TopTeamsPaginator.show_page(TopTeamsPaginator.dataset_key(year, limit), 0)
+        await ctx.send(embed=embed, view=view)
     else:
         embed = discord.Embed(
             title=f"Top {limit} CTF Teams for {year}",
@@ -538,10 +917,102 @@ async def top_teams_command(ctx, year: int = None, limit: int = 10):
         embed.set_footer(text="Data from CTFtime.org")
         await ctx.send(embed=embed)
 
+def parse_event_filters(args):
+    """Turn extra command words into catalogue filters: onsite/online, weight>=N, or a format name"""
+    filters = {}
+    for arg in args:
+        lowered = arg.lower()
+        if lowered in ('onsite', 'online'):
+            filters['onsite'] = lowered == 'onsite'
+        elif lowered.startswith(('weight>=', 'w>=')):
+            filters['min_weight'] = float(lowered.split('>=', 1)[1])
+        else:
+            filters['format'] = lowered
+    return filters
+
+def create_event_list_embed(title, entries, color):
+    embed = discord.Embed(title=title, color=color, timestamp=datetime.now(timezone.utc))
+    if not entries:
+        embed.description = "No matching CTF events found."
+    for start, end, event in entries[:25]:
+        location = "Onsite" if event.get("onsite") else "Online"
+        embed.add_field(
+            name=event["title"][:256],
+            value=f"<t:{start}:F> → <t:{end}:F> (<t:{start}:R>)\n"
+                  f"[CTFtime]({event['ctftime_url']}) | {event.get('format', 'N/A')} | "
+                  f"Weight: {event.get('weight', 'N/A')} | {location}",
+            inline=False
+        )
+    shown = min(len(entries), 25)
+    embed.set_footer(text=f"Showing {shown} of {len(entries)} events | Data from CTFtime.org")
+    return embed
+
+async def send_event_query(ctx, title, query, args, color):
+    try:
+        filters = parse_event_filters(args)
+    except ValueError:
+        await ctx.send("Invalid filter. Use a format name, `onsite`, `online` or `weight>=N`.")
+        return
+    await ctx.send(embed=create_event_list_embed(title, query(**filters), color))
+
+@bot.command(name='upcoming')
+async def upcoming_command(ctx, days: typing.Optional[int] = None, *filters: str):
+    # The catalogue only holds events as far ahead as the widest guild horizon syncs
+    limit = sync_horizon_days()
+    requested = max(days or 7, 1)
+    days = min(requested, limit)
+    now = int(datetime.now(timezone.utc).timestamp())
+    until = now + days * 24 * 60 * 60
+    query = lambda **f: catalogue.upcoming(now, until, **f)
+    title = f"Upcoming CTFs (next {days} days{', the furthest the bot looks ahead' if requested > limit else ''})"
+    await send_event_query(ctx, title, query, filters, discord.Color.blue())
+
+@bot.command(name='running')
+async def running_command(ctx, *filters: str):
+    now = int(datetime.now(timezone.utc).timestamp())
+    query = lambda **f: catalogue.running(now, **f)
+    await send_event_query(ctx, "Running CTFs", query, filters, discord.Color.green())
+
+@bot.command(name='events')
+async def events_command(ctx, start_date: str, end_date: str, *filters: str):
+    try:
+        lo = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        hi = datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+    except ValueError:
+        await ctx.send("Dates must be in YYYY-MM-DD format.")
+        return
+    query = lambda **f: catalogue.query(int(lo.timestamp()), int(hi.timestamp()), **f)
+    await send_event_query(ctx, f"CTFs from {start_date} to {end_date}", query, filters, discord.Color.blue())
+
 @bot.command(name='team')
-async def team_info_command(ctx, team_id: int):
+async def team_info_command(ctx, *, team: str):
+    team = team.strip()
+    if team.isdigit():
+        await send_team_info(ctx, int(team))
+        return
+
+    matches = team_index.search(team)
+    if not matches:
+        await ctx.send(f"No known team matches '{team}'. Try its numeric team ID instead.")
+        return
+
+    # An exact name match, or a single candidate, is unambiguous
+    exact = [match for match in matches if match[2] >= 2.0]
+    if len(exact) == 1 or len(matches) == 1:
+        await send_team_info(ctx, (exact or matches)[0][0])
+        return
+
+    embed = discord.Embed(
+        title=f"Teams matching '{team}'",
+        description="\n".join(f"**{name}** — ID: {team_id}" for team_id, name, score in matches),
+        color=discord.Color.orange()
+    )
+    embed.set_footer(text="Use the team ID to see details")
+    await ctx.send(embed=embed)
+
+async def send_team_info(ctx, team_id):
     await ctx.send(f"Fetching information for Team ID: {team_id}...")
-    team = get_team_info(team_id)
+    team = await get_team_info(team_id)
     if not team:
         await ctx.send("No data found or an error occurred while fetching team information.")
         return
@@ -588,6 +1059,153 @@ async def uptime_command(ctx):
     embed.set_footer(text="CTFtime Discord Bot")
     await ctx.send(embed=embed)
 
+@bot.command(name='stats')
+@commands.is_owner()
+async def stats_command(ctx):
+    embed = discord.Embed(
+        title="Bot Stats",
+        color=discord.Color.green(),
+        timestamp=datetime.now(timezone.utc)
+    )
+
+    commands_by_name = {}
+    for (name, outcome), histogram in metrics.command_latency.series.items():
+        commands_by_name.setdefault(name, []).append((outcome, histogram))
+    lines = []
+    for name, series in sorted(commands_by_name.items(), key=lambda item: -sum(h.count for o, h in item[1])):
+        count = sum(histogram.count for outcome, histogram in series)
+        errors = sum(histogram.count for outcome, histogram in series if outcome == "error")
+        worst = max(histogram.quantile(0.99) for outcome, histogram in series)
+        lines.append(f"`{name}`: {count} runs, {errors} errors, p99 {worst * 1000:.0f}ms")
+    embed.add_field(name="Commands", value="\n".join(lines[:10]) or "None yet", inline=False)
+
+    lines = []
+    for (endpoint,), histogram in sorted(metrics.ctftime_latency.series.items()):
+        statuses = ", ".join(
+            f"{status}: {count}" for (name, status), count in metrics.ctftime_responses.values.items() if name == endpoint
+        )
+        lines.append(f"`{endpoint}`: p50 {histogram.quantile(0.5) * 1000:.0f}ms, p99 {histogram.quantile(0.99) * 1000:.0f}ms ({statuses})")
+    embed.add_field(name="CTFtime requests", value="\n".join(lines) or "None yet", inline=False)
+
+    lines = []
+    for (label, outcome), count in sorted(metrics.discord_calls.values.items()):
+        lines.append(f"{label} {outcome}: {count}")
+    embed.add_field(name="Discord deliveries", value="\n".join(lines) or "None yet", inline=False)
+
+    lines = [f"{stats['name']}: {stats['hit_rate']:.1%} of {stats['hits'] + stats['stale_hits'] + stats['misses']}"
+             for stats in ctftime.cache_stats()]
+    embed.add_field(name="Cache hit rates", value="\n".join(lines), inline=False)
+
+    lag = metrics.loop_lag
+    embed.add_field(
+        name="Event loop lag",
+        value=f"p50 {lag.quantile(0.5) * 1000:.1f}ms | p99 {lag.quantile(0.99) * 1000:.1f}ms | max {lag.max * 1000:.1f}ms",
+        inline=False
+    )
+    embed.set_footer(text="CTFtime Discord Bot")
+    await ctx.send(embed=embed)
+
+@bot.command(name='watchdog')
+@commands.is_owner()
+async def watchdog_command(ctx, mode: str = None, threshold_ms: int = None):
+    if mode == 'on':
+        if threshold_ms is not None:
+            watchdog.threshold = threshold_ms / 1000
+        watchdog.start()
+    elif mode == 'off':
+        watchdog.stop()
+    elif mode is not None:
+        await ctx.send("Usage: watchdog [on|off] [threshold_ms]")
+        return
+
+    embed = discord.Embed(
+        title="Blocking Callback Watchdog",
+        description=f"{'Running' if watchdog.running else 'Stopped'}, threshold {watchdog.threshold * 1000:.0f}ms",
+        color=discord.Color.orange(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    for site, count, total, worst in watchdog.summary()[:10]:
+        embed.add_field(
+            name=site[:256],
+            value=f"{count} stalls | total {total * 1000:.0f}ms | worst {worst * 1000:.0f}ms",
+            inline=False
+        )
+    if watchdog.stalls:
+        site, seconds, stack = watchdog.stalls[-1]
+        embed.add_field(name="Latest stack", value=f"```{stack[-1000:]}```", inline=False)
+    embed.set_footer(text="CTFtime Discord Bot")
+    await ctx.send(embed=embed)
+
+@bot.command(name='profile')
+@commands.is_owner()
+async def profile_command(ctx, seconds: int):
+    if not 1 <= seconds <= MAX_PROFILE_SECONDS:
+        await ctx.send(f"Profile length must be between 1 and {MAX_PROFILE_SECONDS} seconds.")
+        return
+
+    await ctx.send(f"Profiling the event loop for {seconds} seconds...")
+    profiler = SamplingProfiler()
+    folded = await profiler.profile(seconds)
+    await ctx.send(
+        f"Collected {profiler.samples} samples. The file is in folded-stack format for flamegraph.pl or speedscope.",
+        file=discord.File(io.BytesIO(folded.encode()), filename="profile.folded")
+    )
+
+@bot.command(name='cachestats')
+@commands.is_owner()
+async def cache_stats_command(ctx):
+    embed = discord.Embed(
+        title="CTFtime Cache Stats",
+        color=discord.Color.green(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    for stats in ctftime.cache_stats():
+        embed.add_field(
+            name=stats["name"],
+            value=f"Entries: {stats['entries']}/{stats['max_entries']} | TTL: {stats['ttl']}s\n"
+                  f"Hits: {stats['hits']} | Stale: {stats['stale_hits']} | Misses: {stats['misses']}\n"
+                  f"Evictions: {stats['evictions']} | Fallbacks: {stats['fallbacks']} | Hit rate: {stats['hit_rate']:.1%}",
+            inline=False
+        )
+
+    client_stats = ctftime.client.stats()
+    limiter, breaker = client_stats["limiter"], client_stats["breaker"]
+    embed.add_field(
+        name="Rate limiter",
+        value=f"Tokens: {limiter['tokens']}/{limiter['capacity']} at {limiter['rate']}/s\n"
+              f"Acquired: {limiter['acquired']} | Rejected: {limiter['rejected']} | Waited: {limiter['waited']}s",
+        inline=False
+    )
+    embed.add_field(
+        name="Circuit breaker",
+        value=f"State: {breaker['state']} | Consecutive failures: {breaker['consecutive_failures']}\n"
+              f"Times opened: {breaker['times_opened']} | Short-circuited: {breaker['short_circuited']}",
+        inline=False
+    )
+    statuses = ", ".join(f"{status}: {count}" for status, count in client_stats["statuses"].items()) or "none"
+    embed.add_field(
+        name="Requests",
+        value=f"Coalesced: {client_stats['coalesced']} | Retries: {client_stats['retries']}\nResponses: {statuses}",
+        inline=False
+    )
+    embed.set_footer(text="CTFtime Discord Bot")
+    await ctx.send(embed=embed)
+
+@bot.command(name='setstatusmode')
+@has_permissions(manage_guild=True)
+async def set_status_mode(ctx, mode: str):
+    mode = mode.lower()
+    if mode not in ('messages', 'dashboard'):
+        await ctx.send("Status mode must be either 'messages' or 'dashboard'.")
+        return
+
+    update_server_config(ctx.guild.id, 'status_mode', mode)
+    dashboard_hashes.pop(str(ctx.guild.id), None)
+    if mode == 'dashboard':
+        dashboard_updates.trigger()
+
+    await ctx.send(f"CTF status mode has been set to '{mode}'")
+
 @bot.command(name='setprefix')
 @has_permissions(manage_guild=True)
 async def set_prefix(ctx, new_prefix: str):
@@ -595,73 +1213,89 @@ async def set_prefix(ctx, new_prefix: str):
         await ctx.send("Prefix must be 5 characters or less.")
         return
     
-    config = load_server_config()
-    server_id = str(ctx.guild.id)
-    if server_id not in config:
-        config[server_id] = {}
-    config[server_id]['prefix'] = new_prefix
-    save_server_config(config)
-    
+    update_server_config(ctx.guild.id, 'prefix', new_prefix)
+
     await ctx.send(f"Prefix has been set to '{new_prefix}'")
 
+@bot.command(name='setannouncementmode')
+@has_permissions(manage_guild=True)
+async def set_announcement_mode(ctx, mode: str):
+    mode = mode.lower()
+    if mode not in ('embeds', 'digest'):
+        await ctx.send("Announcement mode must be either 'embeds' or 'digest'.")
+        return
+
+    update_server_config(ctx.guild.id, 'announcement_mode', mode)
+
+    await ctx.send(f"Announcement mode has been set to '{mode}'")
+
 @bot.command(name='setannouncementchannel')
 @has_permissions(manage_guild=True)
 async def set_announcement_channel(ctx, channel: discord.TextChannel):
-    config = load_server_config()
-    server_id = str(ctx.guild.id)
-    if server_id not in config:
-        config[server_id] = {}
-    config[server_id]['announcement_channel_id'] = channel.id
-    save_server_config(config)
-    
+    update_server_config(ctx.guild.id, 'announcement_channel_id', channel.id)
+
     await ctx.send(f"Announcement channel has been set to {channel.mention}")
 
-async def post_ctf_events(specific_server_id=None, message=None):
-    config = load_server_config()
-    events_found = False
+@bot.command(name='sethorizon')
+@has_permissions(manage_guild=True)
+async def set_horizon(ctx, days: int):
+    if not 1 <= days <= MAX_HORIZON_DAYS:
+        await ctx.send(f"Horizon must be between 1 and {MAX_HORIZON_DAYS} days.")
+        return
 
-    for server_id, server_config in config.items():
-        if specific_server_id and str(specific_server_id) != server_id:
-            continue
+    update_server_config(ctx.guild.id, 'horizon_days', days)
+
+    await ctx.send(f"New CTFs starting within {days} days will now be announced.")
 
-        announcement_channel_id = server_config.get('announcement_channel_id')
-        if announcement_channel_id:
-            channel = bot.get_channel(announcement_channel_id)
-            if channel is None:
-                print(f"Announcement channel with ID {announcement_channel_id} not found for server {server_id}.")
-                continue
-
-            announced_event_ids = load_announced_events()
-            events = get_ctftime_events()
-
-            new_events = []
-            for event in events:
-                event_id = event["id"]
-                if event_id not in announced_event_ids:
-                    new_events.append(event)
-                    announced_event_ids.add(event_id)
-
-            if not new_events:
-                print(f"No new CTF events to announce for server {server_id}.")
-                continue
-
-            events_found = True
-            for event in new_events:
-                embed = create_ctf_embed(event)
-                try:
-                    await channel.send(embed=embed)
-                    print(f"Announced event: {event['title']} in server {server_id}")
-                except Exception as e:
-                    print(f"Failed to send embed for event {event['title']} in server {server_id}: {e}")
-
-            save_announced_events(announced_event_ids)
-
-    return events_found
-
-@tasks.loop(hours=1)
+async def rate_scoreboard_attachment(ctx, weight, attachment, error_embed):
+    """Rate every team in an uploaded scoreboard and reply with the rated table as a CSV file"""
+    from rating import parse_scoreboard, rate_scoreboard  # imports numpy, so kept off the startup path
+    if attachment.size > MAX_SCOREBOARD_BYTES:
+        await ctx.send("Scoreboard file is too large (max 5 MB).")
+        return
+
+    try:
+        weight = float(weight)
+        teams, places, points = parse_scoreboard(await attachment.read(), attachment.filename)
+        table, ratings, order = rate_scoreboard(weight, teams, places, points)
+    except (ValueError, UnicodeDecodeError) as e:
+        await ctx.send(f"Could not read the scoreboard: {e}")
+        return
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        await ctx.send(embed=error_embed)
+        return
+
+    result_embed = discord.Embed(
+        title="Scoreboard Rating Results",
+        description=f"Rated {len(teams)} teams with weight {weight:.2f}.",
+        color=discord.Color.blue()
+    )
+    top = "\n".join(
+        f"{rank}. {teams[i]} — {ratings[i]:.4f} (place {int(places[i])})"
+        for rank, i in enumerate(order[:10], start=1)
+    )
+    result_embed.add_field(name="Top Ratings", value=top[:1024], inline=False)
+    result_embed.set_footer(text="Full table attached")
+
+    await ctx.send(embed=result_embed, file=discord.File(io.BytesIO(table.encode()), filename="ratings.csv"))
+
+@tasks.loop(seconds=MIN_POLL_INTERVAL)
 async def fetch_events_periodically():
-    print("Automatically fetching and posting new CTF events starting within a week...")
-    await post_ctf_events()
+    print("Automatically fetching and posting new CTF events...")
+    try:
+        if SHARD_IDS is not None:
+            reload_server_config()  # pick up settings changed through other processes
+        await post_ctf_events()
+    except Exception as e:
+        # An uncaught error would end the loop for good
+        print(f"Error in fetch_events_periodically: {e!r}")
+
+    # Poll again soon while CTFtime is changing or an event is about to start, back off otherwise
+    now = int(datetime.now(timezone.utc).timestamp())
+    delay = poller.next_interval(bool(event_sync.last_delta), catalogue.next_start(now), now)
+    fetch_events_periodically.change_interval(seconds=delay)
+    print(f"Next event sync in {delay / 60:.0f} minutes.")
 
 @bot.command(name='rating')
 async def rating(ctx, weight: str = None, total_teams: str = None, 
@@ -676,11 +1310,16 @@ async def rating(ctx, weight: str = None, total_teams: str = None,
     name="Please check your command",
     value="Either the variables aren't properly given or there is some internal error.\n\n"
           "The command format should be:\n"
-          "`!rating [weight] [total_teams] [best_points] [team_place] [team_points]`\n\n"
+          "`!rating [weight] [total_teams] [best_points] [team_place] [team_points]`\n"
+          "or `!rating [weight]` with a CSV/JSON scoreboard attached.\n\n"
           "Please contact @sickinsecure on Discord if you feel like the bot has some bug.",
     inline=False
 )
 
+    if ctx.message.attachments and weight is not None:
+        await rate_scoreboard_attachment(ctx, weight, ctx.message.attachments[0], error_embed)
+        return
+
     if None in [weight, total_teams, best_points, team_place, team_points]:
         await ctx.send(embed=error_embed)
         return
@@ -697,6 +1336,7 @@ async def rating(ctx, weight: str = None, total_teams: str = None,
             await ctx.send(embed=error_embed)
             return
 
+        from rating import calculate_rating
         e_rating = calculate_rating(weight, total_teams, best_points, team_place, team_points)
 
         result_embed = discord.Embed(
@@ -738,14 +1378,15 @@ async def rating(ctx, weight: str = None, total_teams: str = None,
         print(f"Error occurred: {str(e)}")
         await ctx.send(embed=error_embed)
 
-@tasks.loop(minutes=1)
-async def check_ctf_status_periodically():
-    await check_ctf_status()
-
 @bot.event
 async def on_ready():
     print(f"{bot.user.name} has connected to Discord!")
-    fetch_events_periodically.start()
-    check_ctf_status_periodically.start()
+    seed_catalogue()
+    if SHARD_IDS is None:
+        start_leader_duties()
+    else:
+        cluster.start()  # the elected leader starts the sync and the scheduler
+    dashboard_updates.trigger()
 
-bot.run(TOKEN)
\ No newline at end of file
+if __name__ == "__main__":
+    bot.run(TOKEN)
\ No newline at end of file
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+
+# Upper bounds in seconds, Prometheus style; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LOOP_LAG_INTERVAL = 0.5  # seconds between event-loop lag probes
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with approximate quantiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class LabelledHistograms:
+    """One Histogram per label tuple"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        histogram = self.series.get(labels)
+        if histogram is None:
+            histogram = self.series[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, histogram in sorted(self.series.items()):
+            label_text = format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {histogram.sum:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {histogram.count}")
+        return lines
+
+
+class LabelledCounter:
+    """A monotonically increasing count per label tuple"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items(), key=lambda item: tuple(map(str, item[0]))):
+            lines.append(f"{self.name}{{{format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def format_labels(names, values):
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+command_latency = LabelledHistograms(
+    "ctfbot_command_seconds", "Time to run a bot command", ("command", "outcome")
+)
+ctftime_latency = LabelledHistograms(
+    "ctfbot_ctftime_request_seconds", "CTFtime API request attempts by endpoint", ("endpoint",)
+)
+ctftime_responses = LabelledCounter(
+    "ctfbot_ctftime_responses_total", "CTFtime API responses by endpoint and status code or error", ("endpoint", "status")
+)
+discord_calls = LabelledCounter(
+    "ctfbot_discord_calls_total", "Discord API calls made by the delivery dispatcher", ("label", "outcome")
+)
+discord_latency = LabelledHistograms(
+    "ctfbot_discord_call_seconds", "Discord API call latency in the delivery dispatcher", ("label",)
+)
+loop_lag = Histogram((0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+# Callables returning extra exposition lines (e.g. cache stats owned by other modules)
+collectors = []
+
+
+def observe_delivery(report):
+    """Record a delivery.DeliveryReport"""
+    for job in report.jobs:
+        discord_calls.inc((report.label, "ok" if job.ok else "failed"))
+        if job.latency is not None:
+            discord_latency.observe((report.label,), job.latency)
+
+
+def render():
+    lines = []
+    for metric in (command_latency, ctftime_latency, ctftime_responses, discord_calls, discord_latency):
+        lines.extend(metric.render())
+
+    lines.append("# HELP ctfbot_event_loop_lag_seconds How late the event loop woke a sleeping probe")
+    lines.append("# TYPE ctfbot_event_loop_lag_seconds histogram")
+    cumulative = 0
+    for bound, count in zip((*loop_lag.buckets, "+Inf"), loop_lag.counts):
+        cumulative += count
+        lines.append(f'ctfbot_event_loop_lag_seconds_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f"ctfbot_event_loop_lag_seconds_sum {loop_lag.sum:.6f}")
+    lines.append(f"ctfbot_event_loop_lag_seconds_count {loop_lag.count}")
+
+    for collect in collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Event-loop lag probe plus a Prometheus text endpoint at http://host:port/metrics"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.lag_task = None
+
+    async def start(self):
+        if self.lag_task is None:
+            self.lag_task = asyncio.create_task(self.probe_loop_lag())
+        if self.port is None or self.runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, self.host, self.port).start()
+        except OSError as e:
+            # Most likely the port is taken (e.g. by another shard process); carry on without the endpoint
+            print(f"Could not serve metrics on {self.host}:{self.port}: {e}")
+            await self.runner.cleanup()
+            self.runner = None
+            return
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.lag_task is not None:
+            self.lag_task.cancel()
+            self.lag_task = None
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_metrics(self, request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    async def probe_loop_lag(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            loop_lag.observe(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
@@ -0,0 +1,233 @@
+import asyncio
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import discord
+from discord import ButtonStyle
+from discord.ui import Button, View
+
+import ctftime
+
+MAX_CACHED_PAGES = 512
+TOP_TEAMS_CHUNK_SIZE = 50  # teams fetched per step when paging through !topteams
+
+# Strong references to background prefetches so they are not garbage collected
+prefetch_tasks = set()
+
+# (kind, dataset key, page) -> (teams snapshot the page was rendered from, embed)
+page_embeds = OrderedDict()
+
+
+class PageButton(discord.ui.DynamicItem[Button], template=r'page:(?P<kind>[a-z]+):(?P<key>[\w-]+):(?P<page>-?\d+)'):
+    """Previous/Next button whose custom_id carries the dataset key and target page.
+
+    Registered with Bot.add_dynamic_items, so buttons keep working on any message,
+    including ones sent before a restart, without keeping a View per message.
+    """
+
+    def __init__(self, kind, key, page, label="Next", disabled=False):
+        super().__init__(Button(
+            label=label,
+            style=ButtonStyle.grey,
+            custom_id=f"page:{kind}:{key}:{page}",
+            disabled=disabled
+        ))
+        self.kind = kind
+        self.key = key
+        self.page = page
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["kind"], match["key"], int(match["page"]), item.label)
+
+    async def callback(self, interaction):
+        paginator = PAGINATORS.get(self.kind)
+        if paginator is None:
+            await interaction.response.send_message("This leaderboard is no longer available.", ephemeral=True)
+            return
+
+        if paginator.cached_teams(self.key, self.page) is None:
+            # Snapshot evicted or bot restarted: refetching may outlast the interaction deadline
+            await interaction.response.defer()
+            result = await paginator.show_page(self.key, self.page)
+            if result is None:
+                await interaction.followup.send("This leaderboard is no longer available.", ephemeral=True)
+                return
+            embed, view = result
+            await interaction.edit_original_response(embed=embed, view=view)
+            return
+
+        result = await paginator.show_page(self.key, self.page)
+        if result is None:
+            await interaction.response.send_message("This leaderboard is no longer available.", ephemeral=True)
+            return
+        embed, view = result
+        await interaction.response.edit_message(embed=embed, view=view)
+
+
+class LeaderboardPaginator(View, metaclass=ABCMeta):
+    """Stateless pagination over a leaderboard snapshot held in the shared CTFtime caches"""
+
+    kind = None
+    teams_per_page = 10
+
+    def __init__(self, key, page, total_pages):
+        super().__init__(timeout=None)
+        self.add_item(PageButton(self.kind, key, page - 1, "Previous", disabled=page <= 0))
+        self.add_item(PageButton(self.kind, key, page + 1, "Next", disabled=page + 1 >= total_pages))
+
+    @classmethod
+    @abstractmethod
+    async def load_teams(cls, key, page):
+        """Return a list of teams that includes the given page"""
+
+    @classmethod
+    @abstractmethod
+    def cached_teams(cls, key, page):
+        """Return the teams for the page if they are already cached, else None"""
+
+    @classmethod
+    @abstractmethod
+    def create_embed(cls, key, teams, page, total_pages):
+        """Build the embed for one page"""
+
+    @classmethod
+    def total_pages(cls, key, teams):
+        return (len(teams) - 1) // cls.teams_per_page + 1
+
+    @classmethod
+    def prefetch(cls, key, page, teams):
+        """Start loading data for pages after `page` in the background, if needed"""
+
+    @classmethod
+    async def show_page(cls, key, page):
+        """Return (embed, view) for a page of the dataset, or None if it has no data"""
+        teams = await cls.load_teams(key, max(page, 0))
+        if not teams:
+            return None
+
+        total_pages = cls.total_pages(key, teams)
+        page = max(0, min(page, total_pages - 1))
+        cls.prefetch(key, page, teams)
+
+        cache_key = (cls.kind, key, page)
+        cached = page_embeds.get(cache_key)
+        if cached is not None and cached[0] is teams:
+            page_embeds.move_to_end(cache_key)
+            embed = cached[1]
+        else:
+            embed = cls.create_embed(key, teams, page, total_pages)
+            page_embeds[cache_key] = (teams, embed)
+            while len(page_embeds) > MAX_CACHED_PAGES:
+                page_embeds.popitem(last=False)
+
+        return embed, cls(key, page, total_pages)
+
+
+class TopTeamsPaginator(LeaderboardPaginator):
+    kind = "top"
+
+    @staticmethod
+    def dataset_key(year, limit):
+        return f"{year}-{limit}"
+
+    @staticmethod
+    def parse_key(key):
+        year, limit = key.split("-")
+        return int(year), int(limit)
+
+    @classmethod
+    def chunk_limit(cls, limit, page):
+        """Number of top teams to fetch so the page is covered, rounded up to a whole chunk"""
+        needed = (page + 1) * cls.teams_per_page
+        return min(limit, -(-needed // TOP_TEAMS_CHUNK_SIZE) * TOP_TEAMS_CHUNK_SIZE)
+
+    @classmethod
+    async def load_teams(cls, key, page):
+        year, limit = cls.parse_key(key)
+        data = await ctftime.get_top_teams(year=year, limit=cls.chunk_limit(limit, page))
+        return data.get(str(year)) if data else None
+
+    @classmethod
+    def cached_teams(cls, key, page):
+        year, limit = cls.parse_key(key)
+        data = ctftime.top_teams_cache.get(ctftime.top_teams_key(year, cls.chunk_limit(limit, max(page, 0))))
+        return data.get(str(year)) if data else None
+
+    @classmethod
+    def total_pages(cls, key, teams):
+        year, limit = cls.parse_key(key)
+        if len(teams) < cls.chunk_limit(limit, (len(teams) - 1) // cls.teams_per_page):
+            limit = len(teams)  # CTFtime returned fewer teams than asked for, so this is all of them
+        return (limit - 1) // cls.teams_per_page + 1
+
+    @classmethod
+    def prefetch(cls, key, page, teams):
+        # Fetch the next chunk while the user is still reading the last pages of this one
+        year, limit = cls.parse_key(key)
+        if len(teams) < cls.chunk_limit(limit, page):
+            return  # already have every team there is
+        next_limit = cls.chunk_limit(limit, page + 2)
+        if next_limit > cls.chunk_limit(limit, page) and cls.cached_teams(key, page + 2) is None:
+            task = asyncio.create_task(ctftime.get_top_teams(year=year, limit=next_limit))
+            prefetch_tasks.add(task)
+            task.add_done_callback(prefetch_tasks.discard)
+
+    @classmethod
+    def create_embed(cls, key, teams, page, total_pages):
+        year, limit = cls.parse_key(key)
+        start_idx = page * cls.teams_per_page
+        current_teams = teams[start_idx:start_idx + cls.teams_per_page]
+
+        embed = discord.Embed(
+            title=f"Top CTF Teams for {year}",
+            color=discord.Color.purple(),
+            timestamp=datetime.now(timezone.utc)
+        )
+
+        for idx, team in enumerate(current_teams, start=start_idx + 1):
+            embed.add_field(
+                name=f"{idx}. {team['team_name']}",
+                value=f"Points: {team['points']:.2f} | Team ID: {team['team_id']}",
+                inline=False
+            )
+
+        embed.set_footer(text=f"Page {page + 1} of {total_pages} | Data from CTFtime.org")
+        return embed
+
+
+class TeamPaginator(LeaderboardPaginator):
+    kind = "country"
+
+    @classmethod
+    async def load_teams(cls, key, page):
+        return await ctftime.get_top_teams_by_country(key)
+
+    @classmethod
+    def cached_teams(cls, key, page):
+        return ctftime.top_by_country_cache.get(key.lower())
+
+    @classmethod
+    def create_embed(cls, key, teams, page, total_pages):
+        start_idx = page * cls.teams_per_page
+        current_teams = teams[start_idx:start_idx + cls.teams_per_page]
+
+        embed = discord.Embed(
+            title=f"Top CTF Teams for {key.upper()}",
+            color=discord.Color.teal(),
+            timestamp=datetime.now(timezone.utc)
+        )
+
+        for team in current_teams:
+            embed.add_field(
+                name=f"{team['country_place']}. {team['team_name']}",
+                value=f"Global Rank: {team['place']}\nPoints: {team['points']:.2f}\nEvents: {team['events']}",
+                inline=False
+            )
+
+        embed.set_footer(text=f"Page {page + 1} of {total_pages} | Data from CTFtime.org")
+        return embed
+
+
+PAGINATORS = {paginator.kind: paginator for paginator in (TopTeamsPaginator, TeamPaginator)}
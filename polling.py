@@ -0,0 +1,25 @@
+class AdaptivePoller:
+    """Picks the delay before the next CTFtime event sync.
+
+    A sync that found changes drops the interval back to min_interval; each
+    quiet sync multiplies it by `backoff`, up to max_interval. While a
+    catalogued event is about to start the delay is also capped at half the
+    time left until it starts, so late reschedules are still caught.
+    """
+
+    def __init__(self, min_interval, max_interval, backoff=2.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+
+    def next_interval(self, changed, next_start=None, now=None):
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+        delay = self.interval
+        if next_start is not None and now is not None and next_start > now:
+            delay = min(delay, max(self.min_interval, (next_start - now) / 2))
+        return delay
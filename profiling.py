@@ -0,0 +1,147 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+MAX_STALLS_KEPT = 50
+
+
+def short_path(filename):
+    if filename.startswith(PROJECT_ROOT):
+        return os.path.relpath(filename, PROJECT_ROOT)
+    if "site-packages" in filename:
+        return filename.split("site-packages" + os.sep, 1)[-1]
+    return os.path.basename(filename)
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def callsite(frame):
+    """The innermost frame in the bot's own code, as 'file:line in function'; the innermost frame otherwise"""
+    innermost = frame
+    while frame is not None:
+        if frame.f_code.co_filename.startswith(PROJECT_ROOT) and "site-packages" not in frame.f_code.co_filename:
+            break
+        frame = frame.f_back
+    frame = frame or innermost
+    return f"{short_path(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+class BlockingWatchdog:
+    """Flags callbacks that hold the event loop longer than `threshold` seconds.
+
+    The loop bumps a heartbeat every `interval` seconds. A daemon thread
+    checks it, and when the heartbeat is older than the threshold it
+    captures the loop thread's stack right then, while the offending
+    callback is still running. Once the loop recovers, the stall's duration
+    is added to a per-callsite summary.
+    """
+
+    def __init__(self, threshold, interval=0.02):
+        self.threshold = threshold
+        self.interval = interval
+        self.loop = None
+        self.loop_thread = None
+        self.heartbeat = time.monotonic()
+        self.handle = None
+        self.thread = None
+        self.running = False
+        self.stalls = []  # (callsite, seconds, formatted stack), most recent last
+        self.callsites = {}  # callsite -> [count, total seconds, max seconds]
+
+    def start(self):
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.running = True
+        self.beat()
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.watch, name="blocking-watchdog", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def beat(self):
+        self.heartbeat = time.monotonic()
+        if self.running:
+            self.handle = self.loop.call_later(self.interval, self.beat)
+
+    def watch(self):
+        stalled = None  # (heartbeat it stalled at, callsite, stack)
+        while self.running:
+            time.sleep(self.interval)
+            heartbeat = self.heartbeat
+            lag = time.monotonic() - heartbeat - self.interval
+            if stalled is None and lag > self.threshold:
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is not None:
+                    stalled = (heartbeat, callsite(frame), "".join(traceback.format_stack(frame)))
+            elif stalled is not None and heartbeat != stalled[0]:
+                self.record(stalled[1], heartbeat - stalled[0] - self.interval, stalled[2])
+                stalled = None
+
+    def record(self, site, seconds, stack):
+        stats = self.callsites.setdefault(site, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        self.stalls.append((site, seconds, stack))
+        del self.stalls[:-MAX_STALLS_KEPT]
+        print(f"Event loop blocked for {seconds * 1000:.0f}ms at {site}:\n{stack}")
+
+    def summary(self):
+        """[(callsite, count, total seconds, max seconds)], worst total first"""
+        return sorted(((site, *stats) for site, stats in self.callsites.items()), key=lambda item: -item[2])
+
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack from a background thread.
+
+    The result is in the folded-stack format ("outer;inner;leaf count" per
+    line) read by flamegraph.pl, speedscope and most other flame graph tools.
+    The sampler needs the GIL to take a sample, so long C calls that hold it
+    show up under whatever runs next (often the selector) rather than
+    themselves.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+
+    def sample(self, thread_id):
+        frame = sys._current_frames().get(thread_id)
+        labels = []
+        while frame is not None:
+            labels.append(frame_label(frame))
+            frame = frame.f_back
+        if labels:
+            stack = ";".join(reversed(labels))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def run(self, thread_id, seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample(thread_id)
+            time.sleep(self.interval)
+
+    async def profile(self, seconds):
+        """Sample the calling event loop's thread for `seconds` while the loop keeps running"""
+        thread_id = threading.get_ident()
+        await asyncio.get_running_loop().run_in_executor(None, self.run, thread_id, seconds)
+        return self.folded()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
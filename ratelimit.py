@@ -0,0 +1,124 @@
+import asyncio
+import random
+import time
+
+
+class RateLimitedError(Exception):
+    """Raised when a request would have to wait longer than allowed for a token"""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open"""
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by every caller.
+
+    Tokens refill at `rate` per second up to `capacity`. Each acquire takes a
+    token, going into debt if none is left, and sleeps until its token would
+    have been refilled, so waiters are served in arrival order. A caller that
+    would wait longer than max_wait fails straight away instead of queueing.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.acquired = 0
+        self.rejected = 0
+        self.waited = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, max_wait=None):
+        self.refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            self.rejected += 1
+            raise RateLimitedError(f"would wait {wait:.1f}s for a request slot")
+        self.tokens -= 1
+        self.acquired += 1
+        if wait > 0:
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+    def stats(self):
+        self.refill()
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "tokens": round(self.tokens, 2),
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "waited": round(self.waited, 2)
+        }
+
+
+class CircuitBreaker:
+    """Stops calling an unhealthy upstream for a while.
+
+    After `failure_threshold` consecutive failures the breaker opens and every
+    call fails fast for `reset_timeout` seconds. Then it is half-open: one
+    probe request is let through, and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go upstream now"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.short_circuited += 1
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            self.transition("half-open")
+        if self.state == "half-open":
+            if self.probing:
+                self.short_circuited += 1
+                raise CircuitOpenError(f"{self.name} circuit is half-open, probe in flight")
+            self.probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        if self.state != "closed":
+            self.transition("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != "open":
+                self.times_opened += 1
+                self.transition("open")
+
+    def transition(self, state):
+        print(f"{self.name} circuit breaker: {self.state} -> {state}")
+        self.state = state
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited
+        }
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Full-jitter exponential backoff: a random delay up to base * 2**attempt, capped"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+
+import numpy as np
+
+# Accepted column names in uploaded scoreboards, lower-cased
+TEAM_COLUMNS = ("team", "team_name", "name")
+PLACE_COLUMNS = ("place", "pos", "position", "rank")
+POINTS_COLUMNS = ("points", "score", "team_points")
+
+
+def calculate_rating(weight, total_teams, best_points, team_place, team_points):
+
+    points_coef = team_points / best_points if best_points > 0 else 0
+
+    place_coef = 1 / team_place if team_place > 0 else 0
+
+    if points_coef > 0:
+        e_rating = ((points_coef + place_coef) * weight) / (1 / (1 + team_place/total_teams))
+        return e_rating
+    return 0
+
+
+def calculate_ratings(weight, total_teams, best_points, places, points):
+    """Vectorized calculate_rating over arrays of places and points"""
+    places = np.asarray(places, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+
+    if best_points > 0:
+        points_coef = points / best_points
+    else:
+        points_coef = np.zeros_like(points)
+    place_coef = np.divide(1.0, places, out=np.zeros_like(places), where=places > 0)
+
+    ratings = (points_coef + place_coef) * weight * (1 + places / total_teams)
+    return np.where(points_coef > 0, ratings, 0.0)
+
+
+def pick_column(row, names):
+    for name in names:
+        if name in row and row[name] not in (None, ""):
+            return row[name]
+    return None
+
+
+def parse_scoreboard(data, filename=""):
+    """Parse a CSV or JSON scoreboard into (teams, places, points).
+
+    JSON may be a list of rows or a CTFtime scoreboard feed ({"standings": [...]}).
+    Rows need a points/score column; when no place column is given teams are
+    ranked by points. Raises ValueError on anything it cannot read.
+    """
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json") or text.lstrip().startswith(("{", "[")):
+        parsed = json.loads(text)
+        rows = parsed.get("standings", []) if isinstance(parsed, dict) else parsed
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    teams, places, points = [], [], []
+    for index, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Row {index} is not an object")
+        row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        score = pick_column(row, POINTS_COLUMNS)
+        if score is None:
+            raise ValueError(f"Row {index} has no points")
+        place = pick_column(row, PLACE_COLUMNS)
+        teams.append(str(pick_column(row, TEAM_COLUMNS) or f"Team {index}"))
+        places.append(float(place) if place is not None else np.nan)
+        points.append(float(score))
+
+    if not teams:
+        raise ValueError("Scoreboard is empty")
+
+    places = np.asarray(places)
+    points = np.asarray(points)
+    missing = np.isnan(places)
+    if missing.any():
+        # Rank by points, highest first; ties keep upload order
+        order = np.argsort(-points, kind="stable")
+        ranks = np.empty(len(points))
+        ranks[order] = np.arange(1, len(points) + 1)
+        places = np.where(missing, ranks, places)
+    return teams, places, points
+
+
+def rate_scoreboard(weight, teams, places, points, total_teams=None, best_points=None):
+    """Rate a whole scoreboard. Returns CSV text sorted by rating, with how far each team moved"""
+    total_teams = total_teams or len(teams)
+    best_points = best_points if best_points is not None else float(points.max())
+    ratings = calculate_ratings(weight, total_teams, best_points, places, points)
+
+    order = np.argsort(-ratings, kind="stable")
+    rating_ranks = np.empty(len(ratings), dtype=np.int64)
+    rating_ranks[order] = np.arange(1, len(ratings) + 1)
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["rating_rank", "place", "shift", "team", "points", "rating"])
+    for i in order:
+        writer.writerow([
+            rating_ranks[i],
+            int(places[i]),
+            int(places[i]) - rating_ranks[i],
+            teams[i],
+            f"{points[i]:.2f}",
+            f"{ratings[i]:.4f}"
+        ])
+    return output.getvalue(), ratings, order
@@ -0,0 +1,68 @@
+import asyncio
+import heapq
+import time
+
+
+class DeadlineScheduler:
+    """Runs a callback at each CTF start/end deadline instead of polling.
+
+    Deadlines are kept in a min-heap of (unix_time, ctf_id). The run loop
+    sleeps until the earliest one and is woken early whenever a new deadline
+    is armed. Entries left behind when an event's times change are not removed;
+    they just cause one extra callback, which finds nothing due.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.heap = []
+        self.armed = {}  # ctf id -> (start_time, end_time) last pushed
+        self.wakeup = None
+        self.task = None
+
+    def arm(self, ctf_id, start_time, end_time, started=False):
+        """Schedule the start and end transitions of a tracked CTF"""
+        if self.armed.get(ctf_id) == (start_time, end_time):
+            return
+        self.armed[ctf_id] = (start_time, end_time)
+        if not started:
+            heapq.heappush(self.heap, (start_time, ctf_id))
+        heapq.heappush(self.heap, (end_time, ctf_id))
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def forget(self, ctf_id):
+        self.armed.pop(ctf_id, None)
+
+    def next_deadline(self):
+        return self.heap[0][0] if self.heap else None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            now = time.time()
+            due = False
+            while self.heap and self.heap[0][0] <= now:
+                heapq.heappop(self.heap)
+                due = True
+            if due:
+                try:
+                    await self.callback()
+                except Exception as e:
+                    print(f"Error in scheduled CTF status check: {e}")
+                continue
+
+            deadline = self.next_deadline()
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), None if deadline is None else deadline - now)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,31 @@
+import json
+import os
+import zlib
+
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(path, state):
+    """Compress `state` to JSON at path, replacing the old file atomically. Returns the bytes written"""
+    text = json.dumps({"version": SNAPSHOT_VERSION, "state": state}, separators=(",", ":"))
+    data = zlib.compress(text.encode(), 6)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return len(data)
+
+
+def read_snapshot(path):
+    """The state saved by write_snapshot, or None if there is no usable snapshot"""
+    try:
+        with open(path, "rb") as f:
+            snapshot = json.loads(zlib.decompress(f.read()))
+    except FileNotFoundError:
+        return None
+    except (OSError, zlib.error, ValueError) as e:
+        print(f"Ignoring unreadable snapshot {path}: {e!r}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot["state"]
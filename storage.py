@@ -0,0 +1,336 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guild_settings (
+    guild_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (guild_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS tracked_ctfs (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    url TEXT,
+    ctftime_url TEXT,
+    logo TEXT,
+    format TEXT,
+    weight TEXT,
+    started INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tracked_ctfs_start ON tracked_ctfs (start_time);
+CREATE INDEX IF NOT EXISTS tracked_ctfs_end ON tracked_ctfs (end_time);
+
+CREATE TABLE IF NOT EXISTS ctf_status_messages (
+    guild_id TEXT NOT NULL,
+    ctf_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (ctf_id, guild_id)
+);
+
+CREATE TABLE IF NOT EXISTS announcement_deliveries (
+    guild_id TEXT NOT NULL,
+    event_id INTEGER NOT NULL,
+    finish INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS announcement_deliveries_finish ON announcement_deliveries (finish);
+
+CREATE TABLE IF NOT EXISTS team_names (
+    team_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (team_id, name)
+);
+
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cluster_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+CTF_COLUMNS = ("id", "title", "description", "start_time", "end_time", "url",
+               "ctftime_url", "logo", "format", "weight")
+
+
+class Storage:
+    """SQLite (WAL mode) store for guild settings, tracked CTFs and announcement deliveries"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Other shard processes may hold the write lock. Calls block the event loop while they
+        # wait, so keep the wait short and let the odd call fail instead of stalling the gateway
+        self.conn.execute("PRAGMA busy_timeout=250")
+        self.conn.executescript(SCHEMA)
+
+    @property
+    def version(self):
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    # Guild settings
+
+    def load_guild_settings(self):
+        """Return every guild's settings as {guild_id: {key: value}}"""
+        config = {}
+        for row in self.conn.execute("SELECT guild_id, key, value FROM guild_settings"):
+            config.setdefault(row["guild_id"], {})[row["key"]] = json.loads(row["value"])
+        return config
+
+    def set_guild_setting(self, guild_id, key, value):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (guild_id, key) DO UPDATE SET value = excluded.value",
+                (str(guild_id), key, json.dumps(value))
+            )
+
+    # Announcement deliveries
+
+    def delivered_event_ids(self, guild_id, event_ids):
+        """Return the subset of event_ids already announced in the guild"""
+        event_ids = list(event_ids)
+        if not event_ids:
+            return set()
+        placeholders = ", ".join("?" * len(event_ids))
+        rows = self.conn.execute(
+            f"SELECT event_id FROM announcement_deliveries WHERE guild_id = ? AND event_id IN ({placeholders})",
+            (str(guild_id), *event_ids)
+        )
+        return {row["event_id"] for row in rows}
+
+    def event_recipients(self, event_ids):
+        """Return {event_id: set of guild ids} for guilds the events were announced in"""
+        event_ids = list(event_ids)
+        if not event_ids:
+            return {}
+        placeholders = ", ".join("?" * len(event_ids))
+        rows = self.conn.execute(
+            f"SELECT guild_id, event_id FROM announcement_deliveries WHERE event_id IN ({placeholders})",
+            event_ids
+        )
+        recipients = {}
+        for row in rows:
+            recipients.setdefault(row["event_id"], set()).add(row["guild_id"])
+        return recipients
+
+    def record_deliveries(self, deliveries):
+        """Insert (guild_id, event_id, finish) rows"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO announcement_deliveries (guild_id, event_id, finish) VALUES (?, ?, ?)",
+                [(str(guild_id), event_id, finish) for guild_id, event_id, finish in deliveries]
+            )
+
+    def prune_deliveries(self, cutoff):
+        """Delete deliveries for events that finished before cutoff"""
+        with self.conn:
+            return self.conn.execute("DELETE FROM announcement_deliveries WHERE finish < ?", (cutoff,)).rowcount
+
+    # Tracked CTFs
+
+    def track_ctf(self, ctf_info):
+        """Insert a CTF to watch for start/end, or update it if CTFtime changed its details.
+
+        A CTF postponed after it was announced as started is announced again at
+        its new start. Its old status messages are dropped and returned so the
+        caller can delete them.
+        """
+        updates = ", ".join(f"{column} = excluded.{column}" for column in CTF_COLUMNS[1:])
+        updates += ", started = CASE WHEN tracked_ctfs.start_time = excluded.start_time THEN started ELSE 0 END"
+        stale = []
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT start_time, started FROM tracked_ctfs WHERE id = ?", (ctf_info["id"],)
+            ).fetchone()
+            if row is not None and row["started"] and row["start_time"] != ctf_info["start_time"]:
+                stale = self.status_messages([ctf_info["id"]])
+                self.conn.execute("DELETE FROM ctf_status_messages WHERE ctf_id = ?", (ctf_info["id"],))
+            self.conn.execute(
+                f"INSERT INTO tracked_ctfs ({', '.join(CTF_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(CTF_COLUMNS))}) "
+                f"ON CONFLICT (id) DO UPDATE SET {updates}",
+                tuple(ctf_info[column] for column in CTF_COLUMNS)
+            )
+        return stale
+
+    def tracked_ctfs(self):
+        return [dict(row) for row in self.conn.execute("SELECT * FROM tracked_ctfs ORDER BY start_time")]
+
+    def ctfs_starting(self, now):
+        """CTFs whose start time has passed but which have not been announced as started"""
+        rows = self.conn.execute(
+            "SELECT * FROM tracked_ctfs WHERE start_time <= ? AND started = 0 AND end_time > ?",
+            (now, now)
+        )
+        return [dict(row) for row in rows]
+
+    def running_ctfs(self, now):
+        """CTFs that have started and not yet ended, soonest to end first"""
+        rows = self.conn.execute(
+            "SELECT * FROM tracked_ctfs WHERE start_time <= ? AND end_time > ? ORDER BY end_time",
+            (now, now)
+        )
+        return [dict(row) for row in rows]
+
+    def ctfs_ending(self, now):
+        rows = self.conn.execute("SELECT * FROM tracked_ctfs WHERE end_time <= ?", (now,))
+        return [dict(row) for row in rows]
+
+    def mark_started(self, ctf_ids):
+        with self.conn:
+            self.conn.executemany("UPDATE tracked_ctfs SET started = 1 WHERE id = ?", [(i,) for i in ctf_ids])
+
+    def remove_ctfs(self, ctf_ids):
+        with self.conn:
+            self.conn.executemany("DELETE FROM tracked_ctfs WHERE id = ?", [(i,) for i in ctf_ids])
+            self.conn.executemany("DELETE FROM ctf_status_messages WHERE ctf_id = ?", [(i,) for i in ctf_ids])
+
+    # Per-guild CTF status messages
+
+    def add_status_messages(self, messages):
+        """Insert (guild_id, ctf_id, channel_id, message_id) rows"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO ctf_status_messages (guild_id, ctf_id, channel_id, message_id) VALUES (?, ?, ?, ?)",
+                [(str(guild_id), ctf_id, channel_id, message_id) for guild_id, ctf_id, channel_id, message_id in messages]
+            )
+
+    def status_messages(self, ctf_ids):
+        """Return the status messages posted for the given CTFs as dicts"""
+        ctf_ids = list(ctf_ids)
+        if not ctf_ids:
+            return []
+        placeholders = ", ".join("?" * len(ctf_ids))
+        rows = self.conn.execute(f"SELECT * FROM ctf_status_messages WHERE ctf_id IN ({placeholders})", ctf_ids)
+        return [dict(row) for row in rows]
+
+    # Mirrored team names for name search
+
+    def load_team_names(self):
+        return [(row["team_id"], row["name"]) for row in self.conn.execute("SELECT team_id, name FROM team_names")]
+
+    def add_team_names(self, names):
+        """Insert (team_id, name) rows"""
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO team_names (team_id, name) VALUES (?, ?)", names)
+
+    # Coordination between shard processes
+
+    def acquire_lease(self, name, holder, ttl, now):
+        """Take or renew the named lease for `holder`. Returns True if holder now has it"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires "
+                "WHERE leases.holder = excluded.holder OR leases.expires < ?",
+                (name, holder, now + ttl, now)
+            )
+        row = self.conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row["holder"] == holder
+
+    def release_lease(self, name, holder):
+        with self.conn:
+            self.conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+    def publish_message(self, origin, kind, payload, now):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO cluster_messages (origin, kind, payload, created) VALUES (?, ?, ?, ?)",
+                (origin, kind, json.dumps(payload), now)
+            )
+
+    def last_message_id(self):
+        return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM cluster_messages").fetchone()[0]
+
+    def messages_since(self, last_id, origin):
+        """Messages after last_id published by anyone but origin, as (id, kind, payload)"""
+        rows = self.conn.execute(
+            "SELECT id, kind, payload FROM cluster_messages WHERE id > ? AND origin != ? ORDER BY id",
+            (last_id, origin)
+        )
+        return [(row["id"], row["kind"], json.loads(row["payload"])) for row in rows]
+
+    def prune_messages(self, cutoff):
+        with self.conn:
+            return self.conn.execute("DELETE FROM cluster_messages WHERE created < ?", (cutoff,)).rowcount
+
+    # One-time import of the old JSON state files
+
+    def import_json_files(self, server_config_file, ledger_file, announced_events_file, current_ctfs_file):
+        """Import the JSON state files the first time the database is created"""
+        if self.version >= SCHEMA_VERSION:
+            return
+
+        with self.conn:
+            config = {}
+            if os.path.exists(server_config_file):
+                with open(server_config_file, 'r') as f:
+                    config = json.load(f)
+                for guild_id, settings in config.items():
+                    for key, value in settings.items():
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?)",
+                            (guild_id, key, json.dumps(value))
+                        )
+
+            deliveries = []
+            if os.path.exists(ledger_file):
+                with open(ledger_file, 'r') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        deliveries.append((record["guild"], record["event"], record["finish"]))
+            elif os.path.exists(announced_events_file):
+                # The old global set did not say which guild got what, so treat every
+                # event in it as delivered to every guild with an announcement channel
+                with open(announced_events_file, 'r') as f:
+                    event_ids = json.load(f).get("announced_event_ids", [])
+                now = int(datetime.now(timezone.utc).timestamp())
+                for guild_id, settings in config.items():
+                    if settings.get('announcement_channel_id'):
+                        deliveries.extend((guild_id, event_id, now) for event_id in event_ids)
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO announcement_deliveries (guild_id, event_id, finish) VALUES (?, ?, ?)",
+                deliveries
+            )
+
+            if os.path.exists(current_ctfs_file):
+                with open(current_ctfs_file, 'r') as f:
+                    ctfs = json.load(f).get("current_ctfs", [])
+                if isinstance(ctfs, dict):
+                    ctfs = ctfs.get("current_ctfs", [])  # written nested by older versions
+                if isinstance(ctfs, list):
+                    for ctf in ctfs:
+                        self.conn.execute(
+                            f"INSERT OR IGNORE INTO tracked_ctfs ({', '.join(CTF_COLUMNS)}, started) "
+                            f"VALUES ({', '.join('?' * (len(CTF_COLUMNS) + 1))})",
+                            (*(ctf.get(column) for column in CTF_COLUMNS), int(bool(ctf.get("announcement_message_id"))))
+                        )
+
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
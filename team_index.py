@@ -0,0 +1,93 @@
+import unicodedata
+from bisect import bisect_left, insort
+
+MIN_FUZZY_SCORE = 0.3
+
+
+def normalize(name):
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TeamIndex:
+    """Name and alias lookup for CTFtime teams the bot has seen in leaderboards.
+
+    Normalized names are kept in a sorted list for prefix lookups (bisect to the
+    first name >= the prefix and walk forward) and in a trigram index for
+    fuzzy matches, scored by Dice similarity. Names are only ever added, so
+    the index can be refreshed incrementally from each leaderboard fetch.
+    """
+
+    def __init__(self):
+        self.names = {}  # normalized name -> {team_id: display name}
+        self.sorted_names = []
+        self.grams = {}  # trigram -> set of normalized names
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, team_id, name):
+        """Index a team name. Returns True if this (team, name) pair is new"""
+        if not name:
+            return False
+        key = normalize(name)
+        teams = self.names.get(key)
+        if teams is None:
+            teams = self.names[key] = {}
+            insort(self.sorted_names, key)
+            for gram in trigrams(key):
+                self.grams.setdefault(gram, set()).add(key)
+        if team_id in teams:
+            return False
+        teams[team_id] = name
+        return True
+
+    def prefix_matches(self, prefix, limit):
+        matches = []
+        i = bisect_left(self.sorted_names, prefix)
+        while i < len(self.sorted_names) and self.sorted_names[i].startswith(prefix) and len(matches) < limit:
+            matches.append(self.sorted_names[i])
+            i += 1
+        return matches
+
+    def fuzzy_matches(self, query, limit):
+        query_grams = trigrams(query)
+        counts = {}
+        for gram in query_grams:
+            for key in self.grams.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+        scored = []
+        for key, shared in counts.items():
+            score = 2 * shared / (len(query_grams) + len(trigrams(key)))
+            if score >= MIN_FUZZY_SCORE:
+                scored.append((score, key))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored[:limit]
+
+    def search(self, query, limit=10):
+        """Return up to `limit` (team_id, name, score) matches, best first.
+
+        Exact matches score 2.0, prefix matches 1.0 + a bonus for covering more
+        of the name, and fuzzy matches their trigram similarity (< 1.0).
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        scored = {}
+        if query in self.names:
+            scored[query] = 2.0
+        for key in self.prefix_matches(query, limit * 4):
+            scored.setdefault(key, 1.0 + len(query) / len(key))
+        for score, key in self.fuzzy_matches(query, limit * 4):
+            scored.setdefault(key, score)
+
+        results = []
+        for key, score in sorted(scored.items(), key=lambda item: (-item[1], item[0])):
+            for team_id, name in self.names[key].items():
+                results.append((team_id, name, score))
+        return results[:limit]